@@ -0,0 +1,143 @@
+"""Micro-benchmark of every registered distortion at every severity.
+
+    PYTHONPATH=./ python tests/bench_distortions.py --save tests/res_bench/baseline.json
+    PYTHONPATH=./ python tests/bench_distortions.py --compare tests/res_bench/baseline.json
+
+Every call runs through add_distortion on a fixed synthetic corpus (smooth
+gradients, edges and texture) at each size. Reported per call:
+
+    ms_min, ms_median: latency over --repeat timed calls after one warm-up call
+    peak_mb: peak memory traced by tracemalloc during one extra call, covering
+        Python and numpy buffers but not OpenCV's own allocations
+    peak_buffers: peak_mb in units of the input image, i.e. how many image-sized
+        temporaries are alive at once
+
+--compare flags a regression when ms_min grows by more than --threshold and by
+more than --min-ms, or peak_mb grows by more than --threshold, and exits with 1.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from x_distortion import DISTORTIONS, add_distortion, precision
+
+parser = argparse.ArgumentParser(description="Benchmark X-Distortion")
+parser.add_argument("--sizes", type=int, nargs="+", default=[224, 512, 768, 1024])
+parser.add_argument("--severities", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+parser.add_argument("-d", "--distortions", type=str, default=None, help="Regex on the distortion names")
+parser.add_argument("--repeat", type=int, default=3, help="Timed calls per distortion, severity and size")
+parser.add_argument("--precision", type=str, default="float64", choices=sorted(precision.PRECISIONS))
+parser.add_argument("--save", type=str, default=None, help="Write the results as JSON baseline")
+parser.add_argument("--compare", type=str, default=None, help="Baseline JSON to compare against")
+parser.add_argument("--threshold", type=float, default=0.2, help="Relative growth reported as regression")
+parser.add_argument("--min-ms", type=float, default=0.5, help="Latency growth below it is noise")
+
+
+def synthetic_image(size, seed=0):
+    """size x size RGB image with gradients, hard edges and fine texture."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    img = np.stack([x, y, 1 - (x + y) / 2], axis=-1) * 200
+    # blocks with hard edges and a sinusoidal texture on top
+    img += 40 * ((np.floor(x * 8) + np.floor(y * 8)) % 2)[..., None]
+    img += 10 * np.sin(x * size / 3)[..., None] * np.cos(y * size / 5)[..., None]
+    img += rng.normal(0, 4, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def bench_call(img, severity, distortion_name, repeat):
+    np.random.seed(0)
+    add_distortion(img, severity=severity, distortion_name=distortion_name)
+    times = []
+    for _ in range(repeat):
+        np.random.seed(0)
+        start = time.perf_counter()
+        add_distortion(img, severity=severity, distortion_name=distortion_name)
+        times.append((time.perf_counter() - start) * 1000)
+
+    np.random.seed(0)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    add_distortion(img, severity=severity, distortion_name=distortion_name)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak -= base
+    return {
+        "ms_min": round(min(times), 4),
+        "ms_median": round(statistics.median(times), 4),
+        "peak_mb": round(peak / 2**20, 4),
+        "peak_buffers": round(peak / img.nbytes, 3),
+    }
+
+
+def compare(results, baseline, threshold, min_ms):
+    regressions, improvements = [], []
+    for key, new in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        ratio = new["ms_min"] / max(old["ms_min"], 1e-9)
+        if ratio > 1 + threshold and new["ms_min"] - old["ms_min"] > min_ms:
+            regressions.append(f"{key}: {old['ms_min']:.2f} -> {new['ms_min']:.2f} ms ({ratio:.2f}x)")
+        elif ratio < 1 / (1 + threshold) and old["ms_min"] - new["ms_min"] > min_ms:
+            improvements.append(f"{key}: {old['ms_min']:.2f} -> {new['ms_min']:.2f} ms ({ratio:.2f}x)")
+        if new["peak_mb"] > old["peak_mb"] * (1 + threshold) and new["peak_mb"] - old["peak_mb"] > 1:
+            regressions.append(f"{key}: peak {old['peak_mb']:.1f} -> {new['peak_mb']:.1f} MB")
+    return regressions, improvements
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    precision.set_precision(args.precision)
+    names = sorted(DISTORTIONS)
+    if args.distortions:
+        names = [name for name in names if re.search(args.distortions, name)]
+    corpus = {size: synthetic_image(size) for size in args.sizes}
+
+    results = {}
+    for distortion_name in names:
+        for size, img in corpus.items():
+            for severity in args.severities:
+                key = f"{distortion_name}/{severity}/{size}"
+                with np.errstate(all="ignore"):
+                    results[key] = bench_call(img, severity, distortion_name, args.repeat)
+                r = results[key]
+                print(
+                    f"{key:<48} {r['ms_min']:>10.2f} ms  {r['ms_median']:>10.2f} ms  "
+                    f"{r['peak_mb']:>8.1f} MB  {r['peak_buffers']:>6.1f} x"
+                )
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        meta = {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "precision": args.precision,
+        }
+        with open(args.save, "w") as fw:
+            json.dump({"meta": meta, "results": results}, fw, indent=4)
+        print(f"Saved {len(results)} results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as fr:
+            baseline = json.load(fr)["results"]
+        regressions, improvements = compare(results, baseline, args.threshold, args.min_ms)
+        for line in improvements:
+            print(f"faster  {line}")
+        for line in regressions:
+            print(f"SLOWER  {line}")
+        print(f"{len(regressions)} regressions, {len(improvements)} improvements")
+        if regressions:
+            raise SystemExit(1)
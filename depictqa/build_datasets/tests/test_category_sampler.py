@@ -0,0 +1,39 @@
+from collections import Counter
+
+import numpy as np
+from tool import CategorySampler
+
+
+class TopRng:
+    """Generator whose first draws sit just below 1, then the ones of a seeded generator."""
+
+    def __init__(self, seed, num_top):
+        self.rng = np.random.default_rng(seed)
+        self.num_top = num_top
+
+    def random(self, size=None):
+        draws = self.rng.random(size)
+        num_top = min(self.num_top, np.size(draws))
+        self.num_top -= num_top
+        if size is None:
+            return np.nextafter(1.0, 0) if num_top else draws
+        draws[:num_top] = np.nextafter(1.0, 0)
+        return draws
+
+
+if __name__ == "__main__":
+    # 0.1 + 0.2 + 0.3 - 0.3 rounds above 0.1 + 0.2 in the tree, so a draw at the top
+    # of [0, 1) overshoots the remaining categories
+    sampler = CategorySampler({"a": 0.1, "b": 0.2, "c": 0.3})
+    for seed in range(200):
+        assert sampler.sample(TopRng(seed, 1), excluded={"c"}) != ["c"]
+        # "c" drawn first, then the top draw must not land on it again
+        assert sorted(sampler.sample(TopRng(seed, 2), k=3)) == ["a", "b", "c"]
+
+    rng = np.random.default_rng(0)
+    counts = Counter(category for _ in range(20000) for category in sampler.sample(rng, excluded={"c"}))
+    assert set(counts) == {"a", "b"}, counts
+    assert abs(counts["a"] / 20000 - 1 / 3) < 0.02, counts
+    counts = Counter(category for _ in range(20000) for category in sampler.sample(rng, k=2, excluded={"c"}))
+    assert counts["a"] == counts["b"] == 20000, counts
+    print("CategorySampler: never draws a removed or excluded category")
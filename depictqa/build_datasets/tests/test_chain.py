@@ -0,0 +1,38 @@
+import itertools
+
+import numpy as np
+from PIL import Image
+from x_distortion import DISTORTIONS, add_distortion, apply_chain
+from x_distortion.chain import get_float_op
+
+# mean abs diff of the float chain (legacy=False) to step-by-step add_distortion, see chain.py
+MEAN_TOLERANCE = 4
+
+
+if __name__ == "__main__":
+    img = np.array(Image.open("tests/test_image.png").convert("RGB").resize((256, 192), resample=Image.BICUBIC))
+    by_space = {}
+    for distortion_name in sorted(DISTORTIONS):
+        float_op = get_float_op(distortion_name, 1)
+        if float_op is not None:
+            by_space.setdefault(str(float_op[0]), []).append(distortion_name)
+
+    worst = 0.0
+    for names in by_space.values():
+        for pair in itertools.permutations(names, 2):
+            for severity in [1, 3, 5]:
+                steps = [(distortion_name, severity) for distortion_name in pair]
+                with np.errstate(divide="ignore", over="ignore"):
+                    img_ref = apply_chain(img, steps)
+                    img_lq = apply_chain(img, steps, legacy=False)
+                mean = np.abs(img_ref.astype(np.int16) - img_lq).mean()
+                assert mean <= MEAN_TOLERANCE, f"{pair} severity {severity}: mean abs diff {mean:.2f}"
+                worst = max(worst, mean)
+    print(f"same color space pairs: mean abs diff <= {worst:.2f}")
+
+    steps = [("tint_green_LAB", 2), ("blur_gaussian", 3), ("exposure_increase_LAB", 4)]
+    img_ref = img
+    for distortion_name, severity in steps:
+        img_ref = add_distortion(img_ref, severity, distortion_name)
+    assert np.array_equal(apply_chain(img, steps), img_ref)
+    print("legacy: bit-identical to add_distortion step by step")
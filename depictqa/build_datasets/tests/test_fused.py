@@ -0,0 +1,36 @@
+import numpy as np
+from PIL import Image
+import x_distortion
+from x_distortion import FUSED_DISTORTIONS, fused_chain, fused_distortion
+from x_distortion.fused import STRETCH_SPECS, STRETCH_TOLERANCE
+
+
+def rgb_cube():
+    """Every uint8 RGB triple once, as a 4096 x 4096 x 3 image."""
+    v = np.arange(256**3, dtype=np.uint32)
+    img = np.stack(((v >> 16) & 255, (v >> 8) & 255, v & 255), axis=-1)
+    return img.astype(np.uint8).reshape(4096, 4096, 3)
+
+
+if __name__ == "__main__":
+    num_severity = 5
+    img_path = "tests/test_image.png"
+    imgs = [rgb_cube(), np.array(Image.open(img_path).convert("RGB"))]
+    for distortion_name in sorted(FUSED_DISTORTIONS):
+        # the float reference path is kept as fallback, the fast path must match it
+        tolerance = STRETCH_TOLERANCE if distortion_name in STRETCH_SPECS else 0
+        for img in imgs:
+            for severity in range(1, num_severity + 1):
+                with np.errstate(divide="ignore", over="ignore"):
+                    img_ref = getattr(x_distortion, distortion_name)(img.copy(), severity)
+                    img_lq = fused_distortion(img, severity, distortion_name)
+                diff = np.abs(img_ref.astype(np.int16) - img_lq).max()
+                assert diff <= tolerance, f"{distortion_name} severity {severity}: max abs diff {diff}"
+        print(f"{distortion_name}: max abs diff <= {tolerance}")
+
+    steps = [("tint_green_LAB", 2), ("brightness_brighten_shift_HSV", 3), ("saturate_weaken_YCrCb", 4)]
+    img_ref = imgs[0][:512]
+    for distortion_name, severity in steps:
+        img_ref = getattr(x_distortion, distortion_name)(img_ref.copy(), severity)
+    assert np.array_equal(fused_chain(imgs[0][:512], steps), img_ref)
+    print("fused_chain: bit-identical")
@@ -0,0 +1,152 @@
+"""Golden-output regression test of every registered distortion against the baseline tree.
+
+    PYTHONPATH=./ python tests/test_golden.py            # check against tests/golden_outputs.npz
+    PYTHONPATH=./ python tests/test_golden.py --update /tmp/baseline/depictqa/build_datasets
+
+The golden outputs are recorded from the x_distortion of the baseline commit,
+e.g. checked out with
+    git worktree add /tmp/baseline $(git rev-list --max-parents=0 HEAD)
+so every faster implementation is compared with the original functions, not
+with an earlier version of itself.
+
+Every (distortion, severity) runs on the test image at 96 x 128 with np.random
+seeded. Its fingerprint is the sha256 of the whole output and the per-channel
+mean, std, min and max. An output passes if its hash is the golden one, with two
+documented exceptions:
+    blur_zoom: zoom_blur accumulates the zoomed copies in float32, which moves
+        some pixels by 1 (BLUR_ZOOM_TOLERANCE). Each statistic then moves by at
+        most 1 as well.
+    BASELINE_UNSEEDED: the baseline draws these from generators np.random.seed
+        does not reach (numba's and a fresh skimage one), so no baseline output
+        is reproducible. Their mean and std must stay within the spread of the
+        baseline over seeds (SAMPLING_TOLERANCE, the baseline spread over 20
+        seeds is at most 2.01 levels).
+"""
+import argparse
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+
+import numpy as np
+from PIL import Image
+from x_distortion import DISTORTIONS, add_distortion
+
+GOLDEN_PATH = "tests/golden_outputs.npz"
+INPUT_SIZE = (128, 96)
+NUM_SEVERITY = 5
+STATISTICS = ["mean", "std", "min", "max"]
+
+# max abs diff of every statistic of blur_zoom, from +-1 per pixel
+BLUR_ZOOM_TOLERANCE = 1
+BASELINE_UNSEEDED = {"blur_glass", "blur_jitter", "noise_impulse"}
+# max abs diff of the mean and std of BASELINE_UNSEEDED, in levels
+SAMPLING_TOLERANCE = 3
+
+parser = argparse.ArgumentParser(description="Golden-output test of X-Distortion")
+parser.add_argument(
+    "--update",
+    type=str,
+    default=None,
+    metavar="BASELINE_DIR",
+    help="Record the outputs of the x_distortion in BASELINE_DIR (build_datasets of the baseline) as golden",
+)
+parser.add_argument("-d", "--distortions", type=str, default=None, help="Regex on the distortion names")
+
+
+def golden_input():
+    img = Image.open("tests/test_image.png").convert("RGB")
+    return np.array(img.resize(INPUT_SIZE, resample=Image.BICUBIC))
+
+
+def load_baseline(build_datasets_dir):
+    """add_distortion of the x_distortion package in build_datasets_dir, imported next to the current one."""
+    package_dir = os.path.join(build_datasets_dir, "x_distortion")
+    spec = importlib.util.spec_from_file_location(
+        "baseline_x_distortion", os.path.join(package_dir, "__init__.py"), submodule_search_locations=[package_dir]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module.add_distortion
+
+
+def fingerprint(img_lq):
+    """sha256 of the output and its per-channel statistics, len(STATISTICS) x 3."""
+    digest = hashlib.sha256(np.ascontiguousarray(img_lq).tobytes()).hexdigest()
+    pixels = img_lq.reshape(-1, 3).astype(np.float64)
+    stats = np.stack([pixels.mean(axis=0), pixels.std(axis=0), pixels.min(axis=0), pixels.max(axis=0)])
+    return digest, stats
+
+
+def run(add_distortion, img, distortion_name, severity):
+    np.random.seed(0)
+    with np.errstate(all="ignore"):
+        # the baseline quantization_median writes into its input
+        return add_distortion(img.copy(), severity=severity, distortion_name=distortion_name)
+
+
+def check(distortion_name, digest, stats, golden_digest, golden_stats):
+    """Failure message of an output against its golden fingerprint, None if it passes."""
+    diff = np.abs(stats - golden_stats).max(axis=1)
+    drift = ", ".join(f"{name} {value:.2f}" for name, value in zip(STATISTICS, diff))
+    if distortion_name in BASELINE_UNSEEDED:
+        if diff[:2].max() > SAMPLING_TOLERANCE:
+            return f"mean/std beyond {SAMPLING_TOLERANCE}: {drift}"
+    elif digest != golden_digest:
+        if distortion_name != "blur_zoom":
+            return f"hash differs: {drift}"
+        if diff.max() > BLUR_ZOOM_TOLERANCE:
+            return f"statistics beyond {BLUR_ZOOM_TOLERANCE}: {drift}"
+    return None
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    img = golden_input()
+    names = sorted(DISTORTIONS)
+    if args.distortions:
+        names = [name for name in names if re.search(args.distortions, name)]
+
+    if args.update:
+        baseline_add_distortion = load_baseline(args.update)
+        keys, digests, stats = [], [], []
+        for distortion_name in sorted(DISTORTIONS):
+            for severity in range(1, NUM_SEVERITY + 1):
+                digest, stat = fingerprint(run(baseline_add_distortion, img, distortion_name, severity))
+                keys.append(f"{distortion_name}/{severity}")
+                digests.append(digest)
+                stats.append(stat)
+        np.savez_compressed(GOLDEN_PATH, keys=np.array(keys), digests=np.array(digests), stats=np.stack(stats))
+        print(f"Recorded {len(keys)} golden outputs of {args.update} to {GOLDEN_PATH}")
+        raise SystemExit(0)
+
+    with np.load(GOLDEN_PATH) as golden:
+        index = {key: i for i, key in enumerate(golden["keys"].tolist())}
+        golden_digests, golden_stats = golden["digests"].tolist(), golden["stats"]
+
+    failures = []
+    for distortion_name in names:
+        num_failures = len(failures)
+        drifted = []
+        for severity in range(1, NUM_SEVERITY + 1):
+            key = f"{distortion_name}/{severity}"
+            img_lq = run(add_distortion, img, distortion_name, severity)
+            assert img_lq.shape == img.shape and img_lq.dtype == np.uint8, f"{key}: {img_lq.shape} {img_lq.dtype}"
+            assert key in index, f"{key} has no golden output, record it with --update"
+            digest, stats = fingerprint(img_lq)
+            failure = check(distortion_name, digest, stats, golden_digests[index[key]], golden_stats[index[key]])
+            if failure:
+                failures.append(f"{key}: {failure}")
+            elif digest != golden_digests[index[key]]:
+                drifted.append(str(severity))
+        if len(failures) > num_failures:
+            print(f"{distortion_name}: beyond tolerance of the baseline")
+        elif distortion_name in BASELINE_UNSEEDED:
+            print(f"{distortion_name}: within the sampling tolerance of the baseline")
+        elif drifted:
+            print(f"{distortion_name}: within tolerance of the baseline, severity {', '.join(drifted)}")
+        else:
+            print(f"{distortion_name}: bit-identical to the baseline")
+    assert not failures, "outputs beyond tolerance:\n" + "\n".join(failures)
@@ -0,0 +1,30 @@
+import os
+import tarfile
+import tempfile
+
+from PIL import Image
+from image_source import open_image_source, record_name
+
+if __name__ == "__main__":
+    assert record_name("r3.png") == "r3"
+    assert record_name("./r3.png") == "r3"
+    assert record_name("./sub/r3.png") == "sub_r3"
+    assert record_name("/sub/./r3.png") == "sub_r3"
+    assert record_name("sub\\r3.png") == "sub_r3"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_dir = os.path.join(tmp_dir, "refs")
+        os.makedirs(os.path.join(src_dir, "sub"))
+        for rel_path in ["r3.png", "sub/r4.png"]:
+            Image.new("RGB", (32, 32)).save(os.path.join(src_dir, rel_path))
+        # the layout of tar -C refs -cf refs.tar .
+        tar_path = os.path.join(tmp_dir, "refs.tar")
+        with tarfile.open(tar_path, "w") as tar:
+            tar.add(src_dir, arcname=".")
+        with tarfile.open(tar_path) as tar:
+            assert "./r3.png" in tar.getnames()
+
+        tar_names = sorted(record.name for record in open_image_source(tar_path))
+        dir_names = sorted(record.name for record in open_image_source(src_dir, recursive=True))
+        assert tar_names == dir_names == ["r3", "sub_r4"], (tar_names, dir_names)
+    print("record names: ./-prefixed tar members match the directory layout")
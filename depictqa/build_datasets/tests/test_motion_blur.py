@@ -0,0 +1,41 @@
+import math
+
+import numpy as np
+from PIL import Image
+from x_distortion.helper import get_motion_blur_kernel, motion_blur, shift_img
+
+
+def motion_blur_reference(x, radius, sigma, angle):
+    """The shift_img loop motion_blur replaced, kept as regression reference."""
+    width = radius * 2 + 1
+    kernel = get_motion_blur_kernel(width, sigma)
+    point = (width * np.sin(np.deg2rad(angle)), width * np.cos(np.deg2rad(angle)))
+    hypot = math.hypot(point[0], point[1])
+
+    blurred = np.zeros_like(x, dtype=np.float32)
+    for i in range(width):
+        dy = -math.ceil(((i * point[0]) / hypot) - 0.5)
+        dx = -math.ceil(((i * point[1]) / hypot) - 0.5)
+        if np.abs(dy) >= x.shape[0] or np.abs(dx) >= x.shape[1]:
+            break
+        shifted = shift_img(x, dx, dy)
+        blurred = blurred + kernel[i] * shifted
+    return blurred
+
+
+if __name__ == "__main__":
+    img_path = "tests/test_image.png"
+    img = np.array(Image.open(img_path).convert("RGB"))
+    # the blur_motion severities, angles on and off the axes, and an image
+    # smaller than the motion so the taps are cut at the border
+    params = [(5, 3), (10, 5), (15, 7), (15, 9), (20, 12)]
+    angles = [-90, -63.4, -45, -12.5, 0, 7.1, 30, 45, 77.7, 90]
+    for x in [img, img[:12, :40], img[:40, :12]]:
+        for radius, sigma in params:
+            for angle in angles:
+                blurred_ref = motion_blur_reference(x, radius, sigma, angle)
+                blurred = motion_blur(x, radius, sigma, angle)
+                assert blurred.dtype == blurred_ref.dtype and blurred.shape == blurred_ref.shape
+                diff = np.abs(blurred_ref - blurred).max()
+                assert diff == 0, f"radius {radius}, angle {angle}: max abs diff {diff}"
+        print(f"motion_blur {x.shape[:2]}: bit-identical to the shift_img reference")
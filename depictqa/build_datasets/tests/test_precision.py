@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image
+from x_distortion import DISTORTIONS, add_distortion, fused, precision
+
+# max abs diff and min PSNR in dB of the float32 policy to the float64 reference, per distortion
+TOLERANCE = 1
+MIN_PSNR = 60.0
+
+
+def run(img, severity, distortion_name, precision_name):
+    np.random.seed(0)
+    with precision.use_precision(precision_name), np.errstate(all="ignore"):
+        return add_distortion(img, severity=severity, distortion_name=distortion_name)
+
+
+if __name__ == "__main__":
+    num_severity = 5
+    img = np.array(Image.open("tests/test_image.png").convert("RGB").resize((256, 192), resample=Image.BICUBIC))
+    # the policy applies to the reference functions, the fused LUTs are built once in float64
+    fused.ENABLE_FUSED = False
+    assert precision.get_precision() == "float64"
+    for distortion_name in sorted(DISTORTIONS):
+        # already float32 or uint8 throughout
+        if DISTORTIONS[distortion_name].category == "quantization":
+            continue
+        diffs, psnrs = [], []
+        for severity in range(1, num_severity + 1):
+            img_ref = run(img, severity, distortion_name, "float64")
+            img_lq = run(img, severity, distortion_name, "float32")
+            assert img_lq.shape == img_ref.shape and img_lq.dtype == np.uint8
+            diff = np.abs(img_ref.astype(np.int16) - img_lq)
+            diffs.append(int(diff.max()))
+            mse = np.mean(diff.astype(np.float64) ** 2)
+            psnrs.append(float("inf") if mse == 0 else 10 * np.log10(255.0**2 / mse))
+        assert max(diffs) <= TOLERANCE, f"{distortion_name}: max abs diff {diffs} (limit {TOLERANCE})"
+        assert min(psnrs) >= MIN_PSNR, f"{distortion_name}: PSNR {psnrs} (limit {MIN_PSNR})"
+        print(f"{distortion_name}: max abs diff {max(diffs)}, min PSNR {min(psnrs):.1f} dB")
+    assert precision.get_precision() == "float64"
+
+    try:
+        precision.set_precision("float16")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("float16 must be rejected")
@@ -0,0 +1,67 @@
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+from x_distortion import DISTORTIONS, add_distortion, add_distortion_batch, apply_chain, tiled_distortion
+
+NUM_SEVERITY = 5
+STOCHASTIC = sorted(name for name, spec in DISTORTIONS.items() if spec.stochastic)
+
+
+def load_test_image():
+    img = Image.open("tests/test_image.png").convert("RGB")
+    return np.array(img.resize((128, 96), resample=Image.BICUBIC))
+
+
+def render(recipe):
+    distortion_name, severity, seed = recipe
+    return add_distortion(load_test_image(), severity, distortion_name, rng=seed)
+
+
+if __name__ == "__main__":
+    img = load_test_image()
+    recipes = [
+        (name, severity, 1000 * severity + i) for i, name in enumerate(STOCHASTIC) for severity in range(1, NUM_SEVERITY + 1)
+    ]
+
+    np.random.seed(0)
+    state = np.random.get_state()
+    serial = []
+    for distortion_name, severity, seed in recipes:
+        img_lq = add_distortion(img, severity, distortion_name, rng=np.random.default_rng(seed))
+        assert np.array_equal(img_lq, add_distortion(img, severity, distortion_name, rng=seed)), distortion_name
+        other = add_distortion(img, severity, distortion_name, rng=seed + 1)
+        assert not np.array_equal(img_lq, other), f"{distortion_name} ignores its rng"
+        serial.append(img_lq)
+    # an explicit rng never touches the global state
+    assert all(np.array_equal(a, b) for a, b in zip(state[1:], np.random.get_state()[1:]))
+    print(f"{len(STOCHASTIC)} stochastic distortions: reproducible from their rng, global state untouched")
+
+    # the same samples rendered by worker processes in any order
+    with Pool(2) as pool:
+        parallel = pool.map(render, recipes[::-1], chunksize=3)[::-1]
+    for (distortion_name, severity, _), a, b in zip(recipes, serial, parallel):
+        assert np.array_equal(a, b), f"{distortion_name} severity {severity} differs across processes"
+    print("worker processes: bit-identical")
+
+    steps = [("noise_gaussian_RGB", 2), ("blur_motion", 3), ("tint_green_LAB", 1)]
+    for legacy in [False, True]:
+        assert np.array_equal(apply_chain(img, steps, legacy, rng=5), apply_chain(img, steps, legacy, rng=5))
+    print("apply_chain: reproducible from its rng")
+
+    # tiles of a shared draw start from the caller's generator, so they match the whole image
+    rng_tiled, rng_full = np.random.default_rng(3), np.random.default_rng(3)
+    img_lq = tiled_distortion(img, 3, "blur_motion", tile_size=48, rng=rng_tiled)
+    img_ref = add_distortion(img, 3, "blur_motion", rng=rng_full)
+    assert np.abs(img_lq.astype(np.int16) - img_ref).max() <= 1
+    assert rng_tiled.bit_generator.state == rng_full.bit_generator.state
+    print("tiled_distortion: blur_motion matches add_distortion")
+
+    # a shared rng is drawn in image order, whatever the grouping of add_distortion_batch
+    names = ["noise_gaussian_RGB", "blur_motion", "brightness_brighten_shift_RGB", "noise_gaussian_RGB", "blur_motion"]
+    severities = [2, 3, 1, 2, 4]
+    imgs_lq = add_distortion_batch(np.stack([img] * len(names)), names, severities, rng=7)
+    rng = np.random.default_rng(7)
+    for img_lq, distortion_name, severity in zip(imgs_lq, names, severities):
+        assert np.array_equal(img_lq, add_distortion(img, severity, distortion_name, rng=rng)), distortion_name
+    print("add_distortion_batch: same draws as a loop over add_distortion")
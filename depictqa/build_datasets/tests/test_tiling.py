@@ -0,0 +1,60 @@
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+from x_distortion import DISTORTIONS, add_distortion, is_tileable, open_output_memmap, tiled_distortion
+
+# max abs diff of tiled_distortion to add_distortion, see tiling.py
+TOLERANCES = {"blur_lens": 1, "blur_motion": 1, "sharpening_decrease": 1}
+
+
+def run(fn, img, severity, distortion_name, **kwargs):
+    np.random.seed(0)
+    with np.errstate(all="ignore"):
+        return fn(img, severity, distortion_name, **kwargs)
+
+
+if __name__ == "__main__":
+    num_severity = 5
+    # 200 x 300 with 64 px tiles: interior, border and merged last tiles
+    img = np.array(Image.open("tests/test_image.png").convert("RGB").resize((300, 200), resample=Image.BICUBIC))
+    tileable = [name for name in sorted(DISTORTIONS) if is_tileable(name)]
+    for distortion_name in tileable:
+        stochastic = DISTORTIONS[distortion_name].stochastic and distortion_name != "blur_motion"
+        tolerance = TOLERANCES.get(distortion_name, 0)
+        for severity in range(1, num_severity + 1):
+            img_ref = run(add_distortion, img, severity, distortion_name)
+            img_lq = run(tiled_distortion, img, severity, distortion_name, tile_size=64)
+            assert img_lq.shape == img.shape and img_lq.dtype == np.uint8
+            if stochastic:
+                # per-tile draws, only the statistics match
+                gap = np.abs(img_ref.astype(np.float64).mean() - img_lq.mean())
+                assert gap < 2, f"{distortion_name} severity {severity}: mean differs by {gap:.2f}"
+                continue
+            diff = np.abs(img_ref.astype(np.int16) - img_lq).max()
+            assert diff <= tolerance, f"{distortion_name} severity {severity}: max abs diff {diff}"
+        print(f"{distortion_name}: {'same mean' if stochastic else f'max abs diff <= {tolerance}'}")
+
+    for distortion_name in ["blur_zoom", "pixelate", "quantization_otsu"]:
+        try:
+            tiled_distortion(img, 1, distortion_name)
+        except ValueError:
+            continue
+        raise AssertionError(f"{distortion_name} must not be tileable")
+
+    # memmap in, memmap out: peak memory follows the tile, not the 64 MP image
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src = open_output_memmap(os.path.join(tmp_dir, "src.npy"), (8192, 8192, 3))
+        src[:] = np.linspace(0, 255, 8192, dtype=np.uint8)[None, :, None]
+        src.flush()
+        src = np.load(os.path.join(tmp_dir, "src.npy"), mmap_mode="r")
+        out = open_output_memmap(os.path.join(tmp_dir, "out.npy"), src.shape)
+        tracemalloc.start()
+        tiled_distortion(src, 3, "blur_gaussian", out=out, tile_size=512)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert peak < src.nbytes / 8, f"peak {peak / 2**20:.0f} MB for a {src.nbytes / 2**20:.0f} MB image"
+        assert np.array_equal(out[4000:4100, 100:200], add_distortion(np.array(src[3900:4200, :300]), 3, "blur_gaussian")[100:200, 100:200])
+        print(f"blur_gaussian on 8192 x 8192 memmap: peak {peak / 2**20:.0f} MB")
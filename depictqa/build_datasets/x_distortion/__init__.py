@@ -10,13 +10,20 @@ from .saturate import *
 from .exposure import *      
 from .temperature import *   
 from .tint import *          
+from . import fused, precision
+from .fused import FUSED_DISTORTIONS, fused_chain, fused_distortion
+from .registry import DistortionSpec, build_registry
 
-def add_distortion(img, severity=1, distortion_name=None):
+def add_distortion(img, severity=1, distortion_name=None, rng=None):
     """This function distorts the input image.
 
     @param img (np.ndarray, unit8): input image, H x W x 3, RGB, [0, 255]
     @param severity (int): severity of distortion, [1, 5]
     @param distortion_name (str): distortion name
+    @param rng (np.random.Generator | int | None): random source of the
+        stochastic distortions, e.g. seeded per sample with
+        derive_seed(seed, reference, idx); None draws from the global
+        np.random state
     @return: distorted image (np.ndarray, unit8), H x W x 3, RGB, [0, 255]
     """
 
@@ -42,15 +49,96 @@ def add_distortion(img, severity=1, distortion_name=None):
     if severity not in [1, 2, 3, 4, 5]:
         raise AttributeError('The severity must be an integer in [1, 5]')
 
-    if distortion_name:
-        # globals() is a built-in function that returns a dictionary of the current global symbol table.
-        img_lq = globals()[distortion_name](img, severity)
-    else:
+    if not distortion_name:
         raise ValueError("The distortion_name must be passed")
+    if distortion_name not in DISTORTIONS:
+        raise ValueError(f"Unknown distortion_name: {distortion_name}")
+    if distortion_name in FUSED_DISTORTIONS and fused.ENABLE_FUSED:
+        # single-pass LUT / buffer-reusing kernel, see fused.py for the tolerances
+        img_lq = fused_distortion(np.ascontiguousarray(img), severity, distortion_name)
+    else:
+        spec = DISTORTIONS[distortion_name]
+        if spec.mutates_input:
+            # never write into the caller's (possibly read-only, cached) array
+            img = img.copy()
+        if spec.stochastic and rng is not None:
+            img_lq = spec.func(img, severity, rng=np.random.default_rng(rng))
+        else:
+            img_lq = spec.func(img, severity)
 
     return np.uint8(img_lq)
 
 
+def add_distortion_batch(imgs, names, severities, rng=None):
+    """This function distorts a stack of same-size images.
+
+    Samples sharing a (distortion_name, severity) are processed together. The
+    fused pointwise and color-space kernels do not mix pixels, so a group runs
+    as one tall (k*H) x W x 3 image in a single call; other distortions fall
+    back to add_distortion per image, in image order.
+
+    @param imgs (np.ndarray, uint8 or list): N x H x W x 3 stack, or a list of
+        N same-size H x W x 3 images, RGB, [0, 255]
+    @param names (str or list): distortion name, or one per image
+    @param severities (int or list): severity in [1, 5], or one per image
+    @param rng (np.random.Generator | int | None): random source shared by the
+        stochastic distortions in image order, see add_distortion
+    @return: distorted images (np.ndarray, uint8), N x H x W x 3, RGB, [0, 255]
+    """
+    if isinstance(imgs, (list, tuple)):
+        imgs = np.stack(imgs)
+    if not isinstance(imgs, np.ndarray):
+        raise AttributeError('Expecting type(imgs) to be numpy.ndarray or a list of them')
+    if not (imgs.dtype.type is np.uint8):
+        raise AttributeError('Expecting imgs.dtype.type to be numpy.uint8')
+    if imgs.ndim != 4 or imgs.shape[-1] != 3:
+        raise AttributeError('Expecting imgs.shape to be (n x h x w x 3)')
+    n, h, w, _ = imgs.shape
+    if h < 32 or w < 32:
+        raise AttributeError('The (w, h) must be at least 32 pixels')
+
+    # scalars include np.str_ and numpy integers
+    names = [str(names)] * n if np.ndim(names) == 0 else [str(name) for name in names]
+    severities = [severities] * n if np.ndim(severities) == 0 else list(severities)
+    if len(names) != n or len(severities) != n:
+        raise AttributeError('Expecting one distortion_name and severity per image')
+    for severity in severities:
+        if severity not in [1, 2, 3, 4, 5]:
+            raise AttributeError('The severity must be an integer in [1, 5]')
+
+    if rng is not None:
+        rng = np.random.default_rng(rng)
+    imgs = np.ascontiguousarray(imgs)
+    imgs_lq = np.empty_like(imgs)
+    groups = {}
+    for idx, recipe in enumerate(zip(names, severities)):
+        groups.setdefault(recipe, []).append(idx)
+
+    fallback = []
+    for (distortion_name, severity), idxs in groups.items():
+        stackable = (
+            fused.ENABLE_FUSED
+            and distortion_name in FUSED_DISTORTIONS
+            and DISTORTIONS[distortion_name].pointwise
+        )
+        if not stackable:
+            fallback.extend(idxs)
+            continue
+        k = len(idxs)
+        if idxs[-1] - idxs[0] + 1 == k:
+            # contiguous group, work on views without gathering
+            src = imgs[idxs[0] : idxs[-1] + 1].reshape(k * h, w, 3)
+            dst = imgs_lq[idxs[0] : idxs[-1] + 1].reshape(k * h, w, 3)
+            fused_distortion(src, severity, distortion_name, out=dst)
+        else:
+            block = imgs[idxs].reshape(k * h, w, 3)
+            fused_distortion(block, severity, distortion_name, out=block)
+            imgs_lq[idxs] = block.reshape(k, h, w, 3)
+    # image order, so a shared rng gives every image the draws of a plain loop over add_distortion
+    for idx in sorted(fallback):
+        imgs_lq[idx] = add_distortion(imgs[idx], severities[idx], names[idx], rng=rng)
+    return imgs_lq
+
 
 distortions_dict = {
     "brighten": [
@@ -108,6 +196,35 @@ distortions_dict = {
     ],
 }
 
+# distortion_name -> DistortionSpec, see registry.py
+DISTORTIONS = build_registry(
+    [
+        "blur",
+        "brightness",
+        "compression",
+        "contrast",
+        "exposure",
+        "noise",
+        "oversharpen",
+        "pixelate",
+        "quantization",
+        "saturate",
+        "temperature",
+        "tint",
+    ],
+    distortions_dict,
+)
+
+
+def get_distortion_spec(distortion_name):
+    return DISTORTIONS[distortion_name]
+
+
+# needs add_distortion and DISTORTIONS above
+from .chain import apply_chain
+from .tiling import is_tileable, open_output_memmap, tile_halo, tiled_distortion
+
+
 def get_distortion_names(subset=None):
     if subset in distortions_dict:
         print(distortions_dict[subset])
@@ -3,18 +3,44 @@ import numpy as np
 from skimage.filters import gaussian
 
 from .helper import (
-    clipped_zoom,
     gen_disk,
     gen_lensmask,
+    get_rng,
     motion_blur,
     shuffle_pixels_njit,
+    zoom_blur,
 )
+from .precision import as_float, to_float
+
+# per-severity parameters
+BLUR_GAUSSIAN_SIGMAS = [1, 2, 3, 4, 5]
+# (lens mask gamma, sigma)
+BLUR_LENSMASK_PARAMS = [(2.0, 2), (2.4, 4), (3.0, 6), (3.8, 8), (5.0, 10)]
+# (radius, sigma)
+BLUR_MOTION_PARAMS = [(5, 3), (10, 5), (15, 7), (15, 9), (20, 12)]
+# (sigma, shift, iterations)
+BLUR_GLASS_PARAMS = [
+    (0.7, 1, 1),
+    (0.9, 2, 1),
+    (1.2, 2, 2),
+    (1.4, 3, 2),
+    (1.6, 4, 2),
+]
+BLUR_LENS_RADII = [2, 3, 4, 6, 8]
+BLUR_ZOOM_FACTORS = [
+    np.arange(1, 1.03, 0.02),
+    np.arange(1, 1.06, 0.02),
+    np.arange(1, 1.10, 0.02),
+    np.arange(1, 1.15, 0.02),
+    np.arange(1, 1.21, 0.02),
+]
+BLUR_JITTER_SHIFTS = [1, 2, 3, 4, 5]
 
 
 def blur_gaussian(img, severity=1):
     """Gaussian blur."""
-    sigma = [1, 2, 3, 4, 5][severity - 1]
-    img = np.array(img) / 255.0
+    sigma = BLUR_GAUSSIAN_SIGMAS[severity - 1]
+    img = to_float(img)
     img = gaussian(img, sigma=sigma, channel_axis=-1)
     img = np.clip(img, 0, 1) * 255
     return img
@@ -22,46 +48,40 @@ def blur_gaussian(img, severity=1):
 
 def blur_gaussian_lensmask(img, severity=1):
     """Gaussian blur with lens mask."""
-    gamma, sigma = [(2.0, 2), (2.4, 4), (3.0, 6), (3.8, 8), (5.0, 10)][severity - 1]
-    img_orig = np.array(img) / 255.0
+    gamma, sigma = BLUR_LENSMASK_PARAMS[severity - 1]
+    img_orig = to_float(img)
     h, w = img.shape[:2]
-    mask = gen_lensmask(h, w, gamma=gamma)[:, :, None]
+    mask = as_float(gen_lensmask(h, w, gamma=gamma))[:, :, None]
     img = gaussian(img_orig, sigma=sigma, channel_axis=-1)
     img = mask * img_orig + (1 - mask) * img
     img = np.clip(img, 0, 1) * 255
     return img
 
 
-def blur_motion(img, severity=1):
+def blur_motion(img, severity=1, rng=None):
     """Motion blur."""
-    radius, sigma = [(5, 3), (10, 5), (15, 7), (15, 9), (20, 12)][severity - 1]
-    angle = np.random.uniform(-90, 90)
+    radius, sigma = BLUR_MOTION_PARAMS[severity - 1]
+    angle = get_rng(rng).uniform(-90, 90)
     img = np.array(img)
     img = motion_blur(img, radius=radius, sigma=sigma, angle=angle)
     img = np.clip(img, 0, 255)
     return img
 
 
-def blur_glass(img, severity=1):
+def blur_glass(img, severity=1, rng=None):
     """Glass blur."""
-    sigma, shift, iteration = [
-        (0.7, 1, 1),
-        (0.9, 2, 1),
-        (1.2, 2, 2),
-        (1.4, 3, 2),
-        (1.6, 4, 2),
-    ][severity - 1]
-    img = np.array(img) / 255.0
+    sigma, shift, iteration = BLUR_GLASS_PARAMS[severity - 1]
+    img = to_float(img)
     img = gaussian(img, sigma=sigma, channel_axis=-1)
-    img = shuffle_pixels_njit(img, shift=shift, iteration=iteration)
+    img = shuffle_pixels_njit(img, shift=shift, iteration=iteration, rng=rng)
     img = np.clip(gaussian(img, sigma=sigma, channel_axis=-1), 0, 1) * 255
     return img
 
 
 def blur_lens(img, severity=1):
     """Lens blur."""
-    radius = [2, 3, 4, 6, 8][severity - 1]
-    img = np.array(img) / 255.0
+    radius = BLUR_LENS_RADII[severity - 1]
+    img = to_float(img)
     kernel = gen_disk(radius=radius)
     img_lq = []
     for i in range(3):
@@ -73,27 +93,17 @@ def blur_lens(img, severity=1):
 
 def blur_zoom(img, severity=1):
     """Zoom blur."""
-    zoom_factors = [
-        np.arange(1, 1.03, 0.02),
-        np.arange(1, 1.06, 0.02),
-        np.arange(1, 1.10, 0.02),
-        np.arange(1, 1.15, 0.02),
-        np.arange(1, 1.21, 0.02),
-    ][severity - 1]
-    img = (np.array(img) / 255.0).astype(np.float32)
-    h, w = img.shape[:2]
-    img_lq = np.zeros_like(img)
-    for zoom_factor in zoom_factors:
-        zoom_layer = clipped_zoom(img, zoom_factor)
-        img_lq += zoom_layer[:h, :w, :]
+    zoom_factors = BLUR_ZOOM_FACTORS[severity - 1]
+    img = to_float(img, np.float32)
+    img_lq = zoom_blur(img, zoom_factors)
     img_lq = (img + img_lq) / (len(zoom_factors) + 1)
     img_lq = np.clip(img_lq, 0, 1) * 255
     return img_lq
 
 
-def blur_jitter(img, severity=1):
+def blur_jitter(img, severity=1, rng=None):
     """Jitter blur."""
-    shift = [1, 2, 3, 4, 5][severity - 1]
+    shift = BLUR_JITTER_SHIFTS[severity - 1]
     img = np.array(img)
-    img_lq = shuffle_pixels_njit(img, shift=shift, iteration=1)
+    img_lq = shuffle_pixels_njit(img, shift=shift, iteration=1, rng=rng)
     return np.uint8(img_lq)
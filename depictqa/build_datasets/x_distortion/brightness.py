@@ -2,12 +2,23 @@ import cv2
 import numpy as np
 
 from .helper import gen_lensmask
+from .precision import to_float
+
+# per-severity parameters, shared with the fused kernels in fused.py
+BRIGHTNESS_SHIFTS_HSV = [0.1, 0.2, 0.3, 0.4, 0.5]
+BRIGHTNESS_SHIFTS_RGB = [0.1, 0.15, 0.2, 0.27, 0.35]
+BRIGHTEN_GAMMAS_HSV = [0.7, 0.58, 0.47, 0.36, 0.25]
+BRIGHTEN_GAMMAS_RGB = [0.8, 0.7, 0.6, 0.45, 0.3]
+DARKEN_GAMMAS_HSV = [1.5, 1.8, 2.2, 2.7, 3.5]
+DARKEN_GAMMAS_RGB = [1.4, 1.7, 2.1, 2.6, 3.2]
+# per-severity lens mask gamma of brightness_vignette
+VIGNETTE_GAMMAS = [0.5, 0.875, 1.25, 1.625, 2]
 
 
 def brightness_brighten_shift_HSV(img, severity=1):
     """Mean shift V channel in HSV."""
-    shift = [0.1, 0.2, 0.3, 0.4, 0.5][severity - 1]
-    img = np.float32(np.array(img) / 255.0)
+    shift = BRIGHTNESS_SHIFTS_HSV[severity - 1]
+    img = to_float(img, np.float32)
     # RGB->HSV
     img_hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
     img_hsv[:, :, 2] += shift
@@ -18,17 +29,17 @@ def brightness_brighten_shift_HSV(img, severity=1):
 
 def brightness_brighten_shift_RGB(img, severity=1):
     """Mean shift RGB."""
-    shift = [0.1, 0.15, 0.2, 0.27, 0.35][severity - 1]
-    img = np.float32(np.array(img) / 255.0)
+    shift = BRIGHTNESS_SHIFTS_RGB[severity - 1]
+    img = to_float(img, np.float32)
     img_lq = img + shift
     return np.uint8(np.clip(img_lq, 0, 1) * 255.0)
 
 
 def brightness_brighten_gamma_HSV(img, severity=1):
     """Enhance V channel in HSV with a gamma function."""
-    gamma = [0.7, 0.58, 0.47, 0.36, 0.25][severity - 1]
+    gamma = BRIGHTEN_GAMMAS_HSV[severity - 1]
     img_hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-    img_hsv = np.array(img_hsv / 255.0)
+    img_hsv = to_float(img_hsv)
     img_hsv[:, :, 2] = img_hsv[:, :, 2] ** gamma
     img_lq = np.uint8(np.clip(img_hsv, 0, 1) * 255.0)
     img_lq = cv2.cvtColor(img_lq, cv2.COLOR_HSV2RGB)
@@ -37,16 +48,16 @@ def brightness_brighten_gamma_HSV(img, severity=1):
 
 def brightness_brighten_gamma_RGB(img, severity=1):
     """Enhance RGB with a gamma function."""
-    gamma = [0.8, 0.7, 0.6, 0.45, 0.3][severity - 1]
-    img = np.array(img / 255.0)
+    gamma = BRIGHTEN_GAMMAS_RGB[severity - 1]
+    img = to_float(img)
     img_lq = img**gamma
     return np.uint8(np.clip(img_lq, 0, 1) * 255.0)
 
 
 def brightness_darken_shift_HSV(img, severity=1):
     """Mean shift V channel in HSV."""
-    shift = [0.1, 0.2, 0.3, 0.4, 0.5][severity - 1]
-    img = np.float32(np.array(img) / 255.0)
+    shift = BRIGHTNESS_SHIFTS_HSV[severity - 1]
+    img = to_float(img, np.float32)
     img_hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
     img_hsv[:, :, 2] -= shift
     img_lq = cv2.cvtColor(img_hsv, cv2.COLOR_HSV2RGB)
@@ -55,17 +66,17 @@ def brightness_darken_shift_HSV(img, severity=1):
 
 def brightness_darken_shift_RGB(img, severity=1):
     """Mean shift RGB."""
-    shift = [0.1, 0.15, 0.2, 0.27, 0.35][severity - 1]
-    img = np.float32(np.array(img) / 255.0)
+    shift = BRIGHTNESS_SHIFTS_RGB[severity - 1]
+    img = to_float(img, np.float32)
     img_lq = img - shift
     return np.uint8(np.clip(img_lq, 0, 1) * 255.0)
 
 
 def brightness_darken_gamma_HSV(img, severity=1):
     """Reduce V channel in HSV with a gamma function."""
-    gamma = [1.5, 1.8, 2.2, 2.7, 3.5][severity - 1]
+    gamma = DARKEN_GAMMAS_HSV[severity - 1]
     img_hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-    img_hsv = np.array(img_hsv / 255.0)
+    img_hsv = to_float(img_hsv)
     img_hsv[:, :, 2] = img_hsv[:, :, 2] ** gamma
     img_lq = np.uint8(np.clip(img_hsv, 0, 1) * 255.0)
     img_lq = cv2.cvtColor(img_lq, cv2.COLOR_HSV2RGB)
@@ -74,15 +85,15 @@ def brightness_darken_gamma_HSV(img, severity=1):
 
 def brightness_darken_gamma_RGB(img, severity=1):
     """Reduce RGB with a gamma function."""
-    gamma = [1.4, 1.7, 2.1, 2.6, 3.2][severity - 1]
-    img = np.array(img / 255.0)
+    gamma = DARKEN_GAMMAS_RGB[severity - 1]
+    img = to_float(img)
     img_lq = img**gamma
     return np.uint8(np.clip(img_lq, 0, 1) * 255.0)
 
 
 def brightness_vignette(img, severity=1):
     """Vignette effect in RGB."""
-    gamma = [0.5, 0.875, 1.25, 1.625, 2][severity - 1]
+    gamma = VIGNETTE_GAMMAS[severity - 1]
     img = np.array(img)
     h, w = img.shape[:2]
     mask = gen_lensmask(h, w, gamma=gamma)[:, :, None]
@@ -0,0 +1,210 @@
+"""Applying several distortions to one image.
+
+apply_chain(img, steps) runs the steps one after another exactly like calling
+add_distortion step by step: every step quantizes to uint8 RGB, and the
+reference functions clip to the RGB gamut there. The multi-distortion datasets
+are generated this way.
+
+apply_chain(img, steps, legacy=False) keeps the image in one float32 buffer
+instead and only quantizes once, at the end. Each step with a float op here
+converts to its color space, applies the op with the clipping of its reference
+function in that space (e.g. the LAB channels are clipped to their uint8
+range), converts back and clips to the RGB gamut like the reference. Steps in
+the same color space cannot be merged without skipping that gamut clip, which
+drifted by up to 161 levels, so every step converts on its own. What is saved
+are the uint8 round trips and the LUT rebuilds; HSV and RGB steps run about 2x
+faster, LAB steps about as fast as step by step. The output is not equal to the
+step-by-step one: on tests/test_image.png, over all pairs of steps sharing a
+color space, the mean abs diff is at most 4 levels (0.5 on average), and single
+pixels differ by up to 127 where a darkening step leaves them near black: the
+uint8 steps lose their hue and saturation there, the float buffer keeps them.
+Distortions without a float op here (e.g. blur_*, noise_*) run through
+add_distortion on a uint8 copy of the current buffer.
+"""
+import cv2
+import numpy as np
+
+from . import DISTORTIONS, add_distortion
+from .contrast import CONTRAST_SCALE_FACTORS
+from .fused import (
+    HSV,
+    HSV_SHIFT_SPECS,
+    LUT_SPECS,
+    STRETCH_SPECS,
+    _UNIT_F32,
+    _gain_lut,
+    _gamma_v_lut,
+    _rgb_gain_lut,
+    _rgb_gamma_lut,
+    _rgb_shift_lut,
+    _scale_lut,
+    _shift_lut,
+)
+from .oversharpen import OVERSHARPEN_AMOUNTS
+
+# fused.py marks RGB as None, get_float_op returns None for "no float op"
+RGB = "RGB"
+
+
+def _clip(x, lo, hi):
+    np.clip(x, lo, hi, out=x)
+
+
+def _lut_op(build, param, kwargs):
+    """Float32 op equivalent to a fused.py LUT builder."""
+    if build is _rgb_shift_lut:
+        def op(img):
+            img += param
+            _clip(img, 0, 1)
+    elif build is _rgb_gamma_lut:
+        def op(img):
+            np.power(img, param, out=img)
+            _clip(img, 0, 1)
+    elif build is _rgb_gain_lut:
+        def op(img):
+            for c, factor in zip(kwargs["channels"], param):
+                img[:, :, c] *= factor
+            _clip(img, 0, 1)
+    elif build is _gamma_v_lut:
+        # V in [0, 1] in float HSV
+        def op(img):
+            v = img[:, :, 2]
+            _clip(v, 0, 1)
+            np.power(v, param, out=v)
+    elif build is _scale_lut and kwargs.get("center") is None:
+        # S in [0, 1] in float HSV
+        def op(img):
+            for c in kwargs["channels"]:
+                img[:, :, c] *= param
+                _clip(img[:, :, c], 0, 1)
+    elif build is _scale_lut:
+        # Cr, Cb in [0, 1] around 0.5 in float YCrCb
+        def op(img):
+            for c in kwargs["channels"]:
+                ch = img[:, :, c]
+                ch -= 0.5
+                ch *= param
+                ch += 0.5
+                _clip(ch, 0, 1)
+    elif build is _shift_lut:
+        # a, b in [-128, 127] in float LAB, same units as uint8 LAB
+        def op(img):
+            ch = img[:, :, kwargs["channel"]]
+            ch += param
+            _clip(ch, -128, 127)
+    elif build is _gain_lut:
+        # L in [0, 100] in float LAB
+        def op(img):
+            ch = img[:, :, kwargs["channel"]]
+            ch *= param
+            _clip(ch, 0, 100)
+    else:
+        raise ValueError(f"No float op for the LUT builder {build.__name__}")
+    return op
+
+
+def _hsv_shift_op(shift):
+    def op(img):
+        v = img[:, :, 2]
+        v += shift
+        # V above 1 is clipped per channel when leaving HSV, like the reference
+        np.maximum(v, 0, out=v)
+    return op
+
+
+def _stretch_op(factor):
+    def op(img):
+        img_mean = img.mean(axis=(0, 1), dtype=np.float64).astype(np.float32)
+        img += 1e-12
+        np.divide(img_mean, img, out=img)
+        # overflows to inf on black pixels, which still maps to 0
+        with np.errstate(over="ignore"):
+            np.power(img, factor, out=img)
+        img += 1
+        np.reciprocal(img, out=img)
+        _clip(img, 0, 1)
+    return op
+
+
+def _contrast_scale_op(factor):
+    # ImageEnhance.Contrast blends with the mean luma of the image
+    def op(img):
+        luma_mean = float(np.mean(img @ np.float32([0.299, 0.587, 0.114])))
+        img -= luma_mean
+        img *= factor
+        img += luma_mean
+        _clip(img, 0, 1)
+    return op
+
+
+def _oversharpen_op(amount):
+    def op(img):
+        blurred = cv2.GaussianBlur(img, (5, 5), 0)
+        cv2.addWeighted(img, 1 + amount, blurred, -amount, 0, dst=img)
+        _clip(img, 0, 1)
+    return op
+
+
+def get_float_op(distortion_name, severity):
+    """Return (color space, in-place float32 op), or None if the distortion has no float op."""
+    if distortion_name in LUT_SPECS:
+        color_space, build, params, kwargs = LUT_SPECS[distortion_name]
+        return (color_space or RGB), _lut_op(build, params[severity - 1], kwargs)
+    if distortion_name in HSV_SHIFT_SPECS:
+        return HSV, _hsv_shift_op(HSV_SHIFT_SPECS[distortion_name][severity - 1])
+    if distortion_name in STRETCH_SPECS:
+        return RGB, _stretch_op(STRETCH_SPECS[distortion_name][severity - 1])
+    if distortion_name in CONTRAST_SCALE_FACTORS:
+        return RGB, _contrast_scale_op(CONTRAST_SCALE_FACTORS[distortion_name][severity - 1])
+    if distortion_name == "oversharpen":
+        return RGB, _oversharpen_op(OVERSHARPEN_AMOUNTS[severity - 1])
+    return None
+
+
+def _legacy_step(img, severity, distortion_name, rng=None):
+    if distortion_name in STRETCH_SPECS:
+        # the stretch LUT is only within fused.STRETCH_TOLERANCE of the reference
+        return np.uint8(DISTORTIONS[distortion_name].func(img, severity))
+    return add_distortion(img, severity, distortion_name, rng=rng)
+
+
+def apply_chain(img, steps, legacy=True, rng=None):
+    """Apply [(distortion_name, severity), ...] to img in order.
+
+    @param img (np.ndarray, uint8): input image, H x W x 3, RGB, [0, 255]
+    @param steps (list): (distortion_name, severity) pairs, applied in order
+    @param legacy (bool): quantize to uint8 after every step, exactly like
+        calling add_distortion step by step; False keeps one float32 buffer,
+        faster but not equal, see the module docstring
+    @param rng (np.random.Generator | int | None): random source of the
+        stochastic steps, see add_distortion
+    @return: distorted image (np.ndarray, uint8), H x W x 3, RGB, [0, 255]
+    """
+    for distortion_name, _ in steps:
+        if distortion_name not in DISTORTIONS:
+            raise ValueError(f"Unknown distortion_name: {distortion_name}")
+    if rng is not None:
+        rng = np.random.default_rng(rng)
+    if legacy:
+        for distortion_name, severity in steps:
+            img = _legacy_step(img, severity, distortion_name, rng=rng)
+        return np.uint8(img)
+
+    buf = cv2.LUT(np.ascontiguousarray(img), _UNIT_F32)
+    for distortion_name, severity in steps:
+        float_op = get_float_op(distortion_name, severity)
+        if float_op is None:
+            img_u8 = np.uint8(buf * 255.0)
+            buf = cv2.LUT(add_distortion(img_u8, severity, distortion_name, rng=rng), _UNIT_F32)
+            continue
+        color_space, op = float_op
+        if color_space == RGB:
+            op(buf)
+            continue
+        # (RGB -> space, space -> RGB) conversion codes
+        cv2.cvtColor(buf, color_space[0], dst=buf)
+        op(buf)
+        cv2.cvtColor(buf, color_space[1], dst=buf)
+        _clip(buf, 0, 1)
+    buf *= 255.0
+    return np.uint8(buf)
@@ -3,13 +3,17 @@ from io import BytesIO
 import numpy as np
 from PIL import Image
 
+# per-severity encoder quality, JPEG quality and JPEG2000 PSNR (dB) of the single layer
+JPEG_QUALITIES = [25, 18, 12, 8, 5]
+JPEG_2000_QUALITIES = [29, 27.5, 26, 24.5, 23]
+
 
 def compression_jpeg(img, severity=1):
     """JPEG compression."""
     assert img.dtype == np.uint8, "Image array should have dtype of np.uint8"
     assert severity in [1, 2, 3, 4, 5], "Severity must be an integer between 1 and 5."
 
-    quality = [25, 18, 12, 8, 5][severity - 1]
+    quality = JPEG_QUALITIES[severity - 1]
     output = BytesIO()
     gray_scale = False
     if img.shape[2] == 1:
@@ -40,7 +44,7 @@ def compression_jpeg_2000(img, severity=1):
     assert img.dtype == np.uint8, "Image array should have dtype of np.uint8"
     assert severity in [1, 2, 3, 4, 5], "Severity must be an integer between 1 and 5."
 
-    quality = [29, 27.5, 26, 24.5, 23][severity - 1]
+    quality = JPEG_2000_QUALITIES[severity - 1]
     output = BytesIO()
     gray_scale = False
     if img.shape[2] == 1:
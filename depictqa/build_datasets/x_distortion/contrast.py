@@ -1,10 +1,22 @@
 import numpy as np
 from PIL import Image, ImageEnhance
 
+from .precision import to_float
+
+# distortion_name -> per-severity ImageEnhance.Contrast factor, shared with chain.py and tiling.py
+CONTRAST_SCALE_FACTORS = {
+    "contrast_weaken_scale": [0.75, 0.6, 0.45, 0.3, 0.2],
+    "contrast_strengthen_scale": [1.4, 1.7, 2.1, 2.6, 4.0],
+}
+# distortion_name -> per-severity exponent of the stretch sigmoid, shared with fused.py
+CONTRAST_STRETCH_FACTORS = {
+    "contrast_weaken_stretch": [1.0, 0.9, 0.8, 0.6, 0.4],
+    "contrast_strengthen_stretch": [2.0, 4.0, 6.0, 8.0, 10.0],
+}
 
 def contrast_weaken_scale(img, severity=1):
     """Contrast weaken by scaling."""
-    factor = [0.75, 0.6, 0.45, 0.3, 0.2][severity - 1]
+    factor = CONTRAST_SCALE_FACTORS["contrast_weaken_scale"][severity - 1]
     img = Image.fromarray(img)
     enhancer = ImageEnhance.Contrast(img)
     img = enhancer.enhance(factor)
@@ -14,17 +26,19 @@ def contrast_weaken_scale(img, severity=1):
 
 def contrast_weaken_stretch(img, severity=1):
     """Contrast weaken by stretching."""
-    factor = [1.0, 0.9, 0.8, 0.6, 0.4][severity - 1]
-    img = np.array(img) / 255.0
+    factor = CONTRAST_STRETCH_FACTORS["contrast_weaken_stretch"][severity - 1]
+    img = to_float(img)
     img_mean = np.mean(img, axis=(0, 1), keepdims=True)
-    img = 1.0 / (1 + (img_mean / (img + 1e-12)) ** factor)
+    # float32 overflows to inf on black pixels, which still maps to 0
+    with np.errstate(over="ignore"):
+        img = 1.0 / (1 + (img_mean / (img + 1e-12)) ** factor)
     img = np.uint8(np.clip(img, 0, 1) * 255)
     return img
 
 
 def contrast_strengthen_scale(img, severity=1):
     """Contrast strengthen by scaling."""
-    factor = [1.4, 1.7, 2.1, 2.6, 4.0][severity - 1]
+    factor = CONTRAST_SCALE_FACTORS["contrast_strengthen_scale"][severity - 1]
     img = Image.fromarray(img)
     enhancer = ImageEnhance.Contrast(img)
     img = enhancer.enhance(factor)
@@ -34,9 +48,11 @@ def contrast_strengthen_scale(img, severity=1):
 
 def contrast_strengthen_stretch(img, severity=1):
     """Contrast strengthen by stretching."""
-    factor = [2.0, 4.0, 6.0, 8.0, 10.0][severity - 1]
-    img = np.array(img) / 255.0
+    factor = CONTRAST_STRETCH_FACTORS["contrast_strengthen_stretch"][severity - 1]
+    img = to_float(img)
     img_mean = np.mean(img, axis=(0, 1), keepdims=True)
-    img = 1.0 / (1 + (img_mean / (img + 1e-12)) ** factor)
+    # float32 overflows to inf on black pixels, which still maps to 0
+    with np.errstate(over="ignore"):
+        img = 1.0 / (1 + (img_mean / (img + 1e-12)) ** factor)
     img = np.uint8(np.clip(img, 0, 1) * 255)
     return img
@@ -4,10 +4,12 @@ from PIL import Image,ImageEnhance
 
 # Exposure value：+1，光线量翻倍
 # Exposure value：-1，光线量减半
+# per-severity exposure values, shared with the fused kernels in fused.py
+EXPOSURE_EVS = [0.5, 1.0, 1.5, 2.0, 2.5]
 
 # operate on LAB space
 def exposure_increase_LAB(img, severity=1):
-    ev = [0.5, 1.0, 1.5, 2.0, 2.5][severity - 1]
+    ev = EXPOSURE_EVS[severity - 1]
     gain = 2 ** ev
     
     img_lab = cv2.cvtColor(img, cv2.COLOR_RGB2LAB)
@@ -22,7 +24,7 @@ def exposure_increase_LAB(img, severity=1):
     return img_lq
 
 def exposure_decrease_LAB(img,severity=1):
-    ev=[-0.5,-1.0,-1.5,-2.0,-2.5][severity-1]
+    ev=-EXPOSURE_EVS[severity-1]
     gain=2**ev
 
     img_lab=cv2.cvtColor(img,cv2.COLOR_RGB2LAB)
@@ -0,0 +1,247 @@
+"""Fused kernels for the pointwise and color-space distortions.
+
+For uint8 input, brightness_*_shift_RGB, brightness_*_gamma_RGB,
+temperature_*_RGB and tint_*_RGB only depend on the input value of each
+channel, so they are precomputed per (distortion_name, severity) as 256-entry
+per-channel LUTs and applied with a single cv2.LUT. contrast_*_stretch also
+depends on the channel means of the image, so its LUT is built per call.
+
+The channel arithmetic of brightness_*_gamma_HSV, saturate_*, temperature_*_LAB,
+tint_*_LAB and exposure_*_LAB maps one uint8 value of the converted image to one
+uint8 value, so it is folded into a 256-entry per-channel LUT and the whole
+distortion runs as cvtColor -> LUT -> cvtColor on uint8 buffers, without the
+float copies, clip and cast temporaries of the reference functions.
+brightness_*_shift_HSV works on float32 HSV and reuses a single float buffer.
+
+Tolerance: outputs are bit-identical to the reference functions (max abs diff 0),
+since every LUT entry is computed with the same numpy arithmetic as the reference.
+The only exception is contrast_*_stretch (max abs diff 1, see STRETCH_TOLERANCE):
+its channel means are accumulated exactly from integer sums instead of pairwise
+in float64, which can move a value that sits on a quantization boundary.
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from .brightness import (
+    BRIGHTEN_GAMMAS_HSV,
+    BRIGHTEN_GAMMAS_RGB,
+    BRIGHTNESS_SHIFTS_HSV,
+    BRIGHTNESS_SHIFTS_RGB,
+    DARKEN_GAMMAS_HSV,
+    DARKEN_GAMMAS_RGB,
+)
+from .contrast import CONTRAST_STRETCH_FACTORS
+from .exposure import EXPOSURE_EVS
+from .saturate import (
+    SATURATE_STRENGTHEN_SCALES_HSV,
+    SATURATE_STRENGTHEN_SCALES_YCRCB,
+    SATURATE_WEAKEN_SCALES_HSV,
+    SATURATE_WEAKEN_SCALES_YCRCB,
+)
+from .temperature import TEMPERATURE_DOWN_FACTORS, TEMPERATURE_SHIFTS_LAB, TEMPERATURE_UP_FACTORS
+from .tint import TINT_DOWN_FACTORS, TINT_SHIFTS_LAB, TINT_UP_FACTORS
+
+# set to False to route add_distortion through the reference functions
+ENABLE_FUSED = True
+
+RGB = None
+HSV = (cv2.COLOR_RGB2HSV, cv2.COLOR_HSV2RGB)
+YCRCB = (cv2.COLOR_RGB2YCR_CB, cv2.COLOR_YCR_CB2RGB)
+LAB = (cv2.COLOR_RGB2LAB, cv2.COLOR_LAB2RGB)
+
+# uint8 value -> value / 255, same rounding as np.float32(img / 255.0) and img / 255.0
+_UNIT_F32 = np.float32(np.arange(256) / 255.0)
+_UNIT_F64 = np.arange(256) / 255.0
+
+STRETCH_TOLERANCE = 1
+
+
+def _rgb_shift_lut(shift):
+    """brightness_*_shift_RGB: shift all channels in float32."""
+    lut = np.tile(_UNIT_F32[:, None], (1, 3)) + shift
+    return np.uint8(np.clip(lut, 0, 1) * 255.0)
+
+
+def _rgb_gamma_lut(gamma):
+    """brightness_*_gamma_RGB: gamma on all channels in float64."""
+    lut = np.tile(_UNIT_F64[:, None], (1, 3)) ** gamma
+    return np.uint8(np.clip(lut, 0, 1) * 255.0)
+
+
+def _rgb_gain_lut(factors, channels):
+    """temperature_*_RGB & tint_*_RGB: scale some channels in float32."""
+    lut = np.tile(_UNIT_F32[:, None], (1, 3))
+    for c, factor in zip(channels, factors):
+        lut[:, c] = lut[:, c] * factor
+    return np.uint8(np.clip(lut, 0, 1) * 255.0)
+
+
+def stretch_lut(channel_sums, num_pixels, factor):
+    """contrast_*_stretch: sigmoid around the per-channel mean, from the channel sums of the image."""
+    img_mean = np.asarray(channel_sums, dtype=np.float64) / 255.0 / num_pixels
+    lut = 1.0 / (1 + (img_mean / (_UNIT_F64[:, None] + 1e-12)) ** factor)
+    return np.uint8(np.clip(lut, 0, 1) * 255).reshape(256, 1, 3)
+
+
+def _stretch_lut(img, factor):
+    # integer channel sums, exact in float64 up to 2**53 / 255 pixels
+    return stretch_lut(cv2.sumElems(img)[:3], img.shape[0] * img.shape[1], factor)
+
+
+def _gamma_v_lut(gamma):
+    """brightness_*_gamma_HSV: V ** gamma, every channel goes through / 255 * 255."""
+    x = np.arange(256, dtype=np.uint8) / 255.0
+    lut = np.stack((x, x, x**gamma), axis=-1)
+    return np.uint8(np.clip(lut, 0, 1) * 255.0)
+
+
+def _scale_lut(scale, channels, center=None):
+    """saturate_*: scale channels (around center) in float32."""
+    x = np.arange(256, dtype=np.float32)
+    lut = np.stack((x, x, x), axis=-1)
+    for c in channels:
+        if center is None:
+            lut[:, c] = scale * lut[:, c]
+        else:
+            lut[:, c] = center + (lut[:, c] - center) * scale
+    return np.uint8(np.clip(lut, 0, 255))
+
+
+def _shift_lut(shift, channel):
+    """temperature_*_LAB & tint_*_LAB: add shift to one channel in float32."""
+    lut = np.tile(np.arange(256, dtype=np.float32)[:, None], (1, 3))
+    lut[:, channel] = lut[:, channel] + shift
+    return np.clip(lut, 0, 255).astype(np.uint8)
+
+
+def _gain_lut(gain, channel):
+    """exposure_*_LAB: multiply one channel by gain in float32."""
+    lut = np.tile(np.arange(256, dtype=np.float32)[:, None], (1, 3))
+    lut[:, channel] = lut[:, channel] * gain
+    return np.clip(lut, 0, 255).astype(np.uint8)
+
+
+# distortion_name -> (color space, LUT builder, per-severity parameter, builder kwargs)
+LUT_SPECS = {
+    "brightness_brighten_shift_RGB": (RGB, _rgb_shift_lut, BRIGHTNESS_SHIFTS_RGB, {}),
+    "brightness_darken_shift_RGB": (RGB, _rgb_shift_lut, [-shift for shift in BRIGHTNESS_SHIFTS_RGB], {}),
+    "brightness_brighten_gamma_RGB": (RGB, _rgb_gamma_lut, BRIGHTEN_GAMMAS_RGB, {}),
+    "brightness_darken_gamma_RGB": (RGB, _rgb_gamma_lut, DARKEN_GAMMAS_RGB, {}),
+    "temperature_warm_RGB": (
+        RGB, _rgb_gain_lut, list(zip(TEMPERATURE_UP_FACTORS, TEMPERATURE_DOWN_FACTORS)), {"channels": (0, 2)}
+    ),
+    "temperature_cool_RGB": (
+        RGB, _rgb_gain_lut, list(zip(TEMPERATURE_DOWN_FACTORS, TEMPERATURE_UP_FACTORS)), {"channels": (0, 2)}
+    ),
+    "tint_green_RGB": (RGB, _rgb_gain_lut, list(zip(TINT_UP_FACTORS, TINT_DOWN_FACTORS)), {"channels": (1, 0)}),
+    "tint_magenta_RGB": (RGB, _rgb_gain_lut, list(zip(TINT_UP_FACTORS, TINT_DOWN_FACTORS)), {"channels": (0, 1)}),
+    "brightness_brighten_gamma_HSV": (HSV, _gamma_v_lut, BRIGHTEN_GAMMAS_HSV, {}),
+    "brightness_darken_gamma_HSV": (HSV, _gamma_v_lut, DARKEN_GAMMAS_HSV, {}),
+    "saturate_weaken_HSV": (HSV, _scale_lut, SATURATE_WEAKEN_SCALES_HSV, {"channels": (1,)}),
+    "saturate_strengthen_HSV": (HSV, _scale_lut, SATURATE_STRENGTHEN_SCALES_HSV, {"channels": (1,)}),
+    "saturate_weaken_YCrCb": (
+        YCRCB, _scale_lut, SATURATE_WEAKEN_SCALES_YCRCB, {"channels": (1, 2), "center": 128}
+    ),
+    "saturate_strengthen_YCrCb": (
+        YCRCB, _scale_lut, SATURATE_STRENGTHEN_SCALES_YCRCB, {"channels": (1, 2), "center": 128}
+    ),
+    "temperature_warm_LAB": (LAB, _shift_lut, TEMPERATURE_SHIFTS_LAB, {"channel": 2}),
+    "temperature_cool_LAB": (LAB, _shift_lut, [-shift for shift in TEMPERATURE_SHIFTS_LAB], {"channel": 2}),
+    "tint_green_LAB": (LAB, _shift_lut, [-shift for shift in TINT_SHIFTS_LAB], {"channel": 1}),
+    "tint_magenta_LAB": (LAB, _shift_lut, TINT_SHIFTS_LAB, {"channel": 1}),
+    "exposure_increase_LAB": (LAB, _gain_lut, [2**ev for ev in EXPOSURE_EVS], {"channel": 0}),
+    "exposure_decrease_LAB": (LAB, _gain_lut, [2**-ev for ev in EXPOSURE_EVS], {"channel": 0}),
+}
+
+# distortion_name -> per-severity shift of V in float32 HSV
+HSV_SHIFT_SPECS = {
+    "brightness_brighten_shift_HSV": BRIGHTNESS_SHIFTS_HSV,
+    "brightness_darken_shift_HSV": [-shift for shift in BRIGHTNESS_SHIFTS_HSV],
+}
+
+# distortion_name -> per-severity exponent of the stretch sigmoid
+STRETCH_SPECS = CONTRAST_STRETCH_FACTORS
+
+FUSED_DISTORTIONS = frozenset(LUT_SPECS) | frozenset(HSV_SHIFT_SPECS) | frozenset(STRETCH_SPECS)
+
+
+@lru_cache(maxsize=None)
+def get_channel_lut(distortion_name, severity):
+    """Per-channel LUT of a distortion in its color space, uint8, read-only.
+
+    Shaped (256,) when all channels share one table, since cv2.LUT is about 3x
+    faster with a single-channel table, and (256, 1, 3) otherwise.
+    """
+    _, build, params, kwargs = LUT_SPECS[distortion_name]
+    lut = build(params[severity - 1], **kwargs)
+    if (lut == lut[:, :1]).all():
+        lut = np.ascontiguousarray(lut[:, 0])
+    else:
+        lut = np.ascontiguousarray(lut.reshape(256, 1, 3))
+    lut.flags.writeable = False
+    return lut
+
+
+def _hsv_shift(img, shift, out, scratch=None):
+    """brightness_*_shift_HSV on one float32 buffer."""
+    if scratch is None or scratch.shape != img.shape or scratch.dtype != np.float32:
+        scratch = np.empty(img.shape, dtype=np.float32)
+    np.take(_UNIT_F32, img, out=scratch)
+    cv2.cvtColor(scratch, cv2.COLOR_RGB2HSV, dst=scratch)
+    scratch[:, :, 2] += shift
+    cv2.cvtColor(scratch, cv2.COLOR_HSV2RGB, dst=scratch)
+    np.clip(scratch, 0, 1, out=scratch)
+    scratch *= 255.0
+    np.copyto(out, scratch, casting="unsafe")
+    return out
+
+
+def fused_distortion(img, severity, distortion_name, out=None, scratch=None):
+    """Apply a pointwise or color-space distortion in a single fused pass.
+
+    @param img (np.ndarray, uint8): input image, H x W x 3, RGB, C-contiguous
+    @param severity (int): severity of distortion, [1, 5]
+    @param distortion_name (str): one of FUSED_DISTORTIONS
+    @param out (np.ndarray, uint8): optional preallocated output, may alias img
+    @param scratch (np.ndarray): optional intermediate buffer, uint8 for LUT
+        distortions and float32 for brightness_*_shift_HSV
+    @return: distorted image (np.ndarray, uint8), H x W x 3, RGB, [0, 255]
+    """
+    if out is None:
+        out = np.empty_like(img)
+    if distortion_name in HSV_SHIFT_SPECS:
+        shift = HSV_SHIFT_SPECS[distortion_name][severity - 1]
+        return _hsv_shift(img, shift, out, scratch=scratch)
+    if distortion_name in STRETCH_SPECS:
+        factor = STRETCH_SPECS[distortion_name][severity - 1]
+        return cv2.LUT(img, _stretch_lut(img, factor), dst=out)
+
+    color_space, _, _, _ = LUT_SPECS[distortion_name]
+    if color_space is RGB:
+        return cv2.LUT(img, get_channel_lut(distortion_name, severity), dst=out)
+    forward, inverse = color_space
+    if scratch is None or scratch.shape != img.shape or scratch.dtype != np.uint8:
+        scratch = np.empty_like(img)
+    cv2.cvtColor(img, forward, dst=scratch)
+    cv2.LUT(scratch, get_channel_lut(distortion_name, severity), dst=scratch)
+    cv2.cvtColor(scratch, inverse, dst=out)
+    return out
+
+
+def fused_chain(img, steps):
+    """Apply [(distortion_name, severity), ...] in order with two reused buffers.
+
+    Equivalent to calling add_distortion step by step, every intermediate is
+    still quantized to uint8 RGB so results stay bit-identical.
+    """
+    img = np.ascontiguousarray(img)
+    out = np.empty_like(img)
+    scratch_u8 = np.empty_like(img)
+    scratch_f32 = np.empty(img.shape, dtype=np.float32)
+    src = img
+    for distortion_name, severity in steps:
+        scratch = scratch_f32 if distortion_name in HSV_SHIFT_SPECS else scratch_u8
+        src = fused_distortion(src, severity, distortion_name, out=out, scratch=scratch)
+    return out if steps else img.copy()
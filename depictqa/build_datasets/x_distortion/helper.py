@@ -1,29 +1,33 @@
 import math
+from functools import lru_cache
 
+import cv2
 import numpy as np
 from numba import njit
 from scipy.ndimage import zoom as scizoom
 
 
+# cached per shape/parameter; returned arrays are read-only since they are shared
+@lru_cache(maxsize=16)
 def gen_lensmask(h, w, gamma):
     """For blur_gaussian_lensmask & brightness_vignette."""
-    dist1 = np.array([list(range(w))] * h) - w // 2
-    dist2 = np.array([list(range(h))] * w) - h // 2
-    dist2 = np.transpose(dist2, (1, 0))
+    dist2, dist1 = np.ogrid[-(h // 2) : h - h // 2, -(w // 2) : w - w // 2]
     dist = np.sqrt((dist1**2 + dist2**2)) / np.sqrt((w**2 + h**2) / 4)
     mask = (1 - dist) ** gamma
+    mask.flags.writeable = False
     return mask
 
 
+@lru_cache(maxsize=32)
 def gen_disk(radius, dtype=np.float32):
     """For blur_lens."""
     if radius <= 8:
         L = np.arange(-8, 8 + 1)
     else:
         L = np.arange(-radius, radius + 1)
-    X, Y = np.meshgrid(L, L)
-    disk = np.array((X**2 + Y**2) <= radius**2, dtype=dtype)
+    disk = np.array((L[None, :] ** 2 + L[:, None] ** 2) <= radius**2, dtype=dtype)
     disk /= np.sum(disk)
+    disk.flags.writeable = False
     return disk
 
 
@@ -43,6 +47,44 @@ def clipped_zoom(img, zoom_factor):
     return img
 
 
+def get_clipped_zoom_matrix(shape, zoom_factor):
+    """Inverse affine map (output -> input pixel) of clipped_zoom(img, zoom_factor)[:h, :w].
+
+    scipy.ndimage.zoom maps the corners of the center crop onto the corners of
+    its round(crop * zoom_factor) output, so each axis is a scale and offset.
+    """
+    matrix = np.zeros((2, 3), dtype=np.float64)
+    for axis, row in ((0, 1), (1, 0)):
+        ch = int(np.ceil(shape[axis] / float(zoom_factor)))
+        top = (shape[axis] - ch) // 2
+        out = round(ch * zoom_factor)
+        matrix[row, 1 - axis] = (ch - 1) / (out - 1)
+        matrix[row, 2] = top
+    return matrix
+
+
+def zoom_blur(img, zoom_factors):
+    """For blur_zoom. Sum of clipped_zoom(img, z)[:h, :w] over zoom_factors.
+
+    Every zoom is one bilinear cv2.warpAffine of the full image into a shared
+    buffer, instead of a scipy zoom of the crop into an oversized output.
+    """
+    h, w = img.shape[:2]
+    layer = np.empty_like(img)
+    img_lq = np.zeros_like(img)
+    for zoom_factor in zoom_factors:
+        cv2.warpAffine(
+            img,
+            get_clipped_zoom_matrix(img.shape, zoom_factor),
+            (w, h),
+            dst=layer,
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
+        img_lq += layer
+    return img_lq
+
+
 def get_motion_blur_kernel(width, sigma):
     def gauss_function(x, mean, sigma):
         return (np.exp(-((x - mean) ** 2) / (2 * (sigma**2)))) / (
@@ -73,36 +115,103 @@ def shift_img(img, dx, dy):
     return shifted
 
 
-def motion_blur(x, radius, sigma, angle):
-    """For blur_motion."""
+def get_motion_blur_taps(shape, radius, sigma, angle):
+    """(dy, dx, weight) of every shifted copy summed by motion_blur."""
     width = radius * 2 + 1
     kernel = get_motion_blur_kernel(width, sigma)
     point = (width * np.sin(np.deg2rad(angle)), width * np.cos(np.deg2rad(angle)))
     hypot = math.hypot(point[0], point[1])
 
-    blurred = np.zeros_like(x, dtype=np.float32)
+    taps = []
     for i in range(width):
         dy = -math.ceil(((i * point[0]) / hypot) - 0.5)
         dx = -math.ceil(((i * point[1]) / hypot) - 0.5)
-        if np.abs(dy) >= x.shape[0] or np.abs(dx) >= x.shape[1]:
+        if np.abs(dy) >= shape[0] or np.abs(dx) >= shape[1]:
             # simulated motion exceeded img borders
             break
-        shifted = shift_img(x, dx, dy)
-        blurred = blurred + kernel[i] * shifted
+        taps.append((dy, dx, kernel[i]))
+    return taps
+
+
+def motion_blur(x, radius, sigma, angle):
+    """For blur_motion.
+
+    Sum of x shifted by every tap of get_motion_blur_taps, borders replicated
+    like shift_img. The shifted copies are views of one padded copy instead of
+    two np.roll copies per tap, and the taps are added in float64 in the same
+    order as the shift_img loop, so the output is bit-identical to it.
+    """
+    taps = get_motion_blur_taps(x.shape, radius, sigma, angle)
+    x = np.asarray(x)
+    h, w = x.shape[:2]
+    dys = [dy for dy, _, _ in taps]
+    dxs = [dx for _, dx, _ in taps]
+    top, bottom = max(max(dys), 0), max(-min(dys), 0)
+    left, right = max(max(dxs), 0), max(-min(dxs), 0)
+
+    padded = cv2.copyMakeBorder(x, top, bottom, left, right, cv2.BORDER_REPLICATE)
+    blurred = np.zeros(x.shape, dtype=np.float64)
+    product = np.empty_like(blurred)
+    for dy, dx, weight in taps:
+        shifted = padded[top - dy : top - dy + h, left - dx : left - dx + w]
+        np.multiply(shifted, weight, out=product)
+        blurred += product
     return blurred
 
 
-# Numba nopython compilation to shuffle_pixles
-@njit()
-def shuffle_pixels_njit(img, shift, iteration):
-    """For blur_glass & blur_jitter."""
+@njit(cache=True)
+def _shuffle_pixels_kernel(img, shift, codes, deltas):
+    """Serial kernel of shuffle_pixels_njit, pixel (h, w) reads from flat offset deltas[codes[it, i, j]]."""
+    height, width, channels = img.shape
+    flat = img.reshape(-1)
+    for it in range(codes.shape[0]):
+        for i in range(codes.shape[1]):
+            # same visiting order as before: h and w from high to low
+            row_end = ((height - shift - i) * width + width - shift) * channels
+            for j in range(codes.shape[2]):
+                dst = row_end - j * channels
+                src = dst + deltas[codes[it, i, j]]
+                # the original tuple "swap" of two pixel views copies the
+                # neighbour into (h, w) and leaves the neighbour unchanged
+                for c in range(channels):
+                    flat[dst + c] = flat[src + c]
+    return img
+
+
+def get_rng(rng=None):
+    """Random source of the stochastic distortions.
+
+    @param rng (np.random.Generator | int | None): generator or seed, None is
+        the global np.random state, which has the same normal / uniform /
+        poisson methods
+    """
+    return np.random if rng is None else np.random.default_rng(rng)
+
+
+def shuffle_pixels_njit(img, shift, iteration, rng=None):
+    """For blur_glass & blur_jitter. Locally shuffles the pixels of img in place.
+
+    Every pixel copies a neighbour at (dx, dy) in [-shift, shift)^2. The offsets
+    are drawn up front as one uint16 code per pixel instead of one
+    np.random.randint call per pixel inside numba, whose RNG ignores
+    np.random.seed called from Python.
+
+    @param rng (np.random.Generator | int | None): generator or seed for the
+        offsets, None draws the seed from the global np.random state
+    """
+    if rng is None:
+        rng = np.random.randint(2**63 - 1, dtype=np.int64)
+    rng = np.random.default_rng(rng)
     height, width = img.shape[:2]
-    # locally shuffle pixels
-    for _ in range(iteration):
-        for h in range(height - shift, shift, -1):
-            for w in range(width - shift, shift, -1):
-                dx, dy = np.random.randint(-shift, shift, size=(2,))
-                h_prime, w_prime = h + dy, w + dx
-                # swap
-                img[h, w], img[h_prime, w_prime] = img[h_prime, w_prime], img[h, w]
+    img_3d = np.ascontiguousarray(img if img.ndim == 3 else img[:, :, None])
+    channels = img_3d.shape[2]
+    n = 2 * shift
+    codes = rng.integers(
+        0, n * n, size=(iteration, max(height - 2 * shift, 0), max(width - 2 * shift, 0)), dtype=np.uint16
+    )
+    dy, dx = np.divmod(np.arange(n * n), n)
+    deltas = ((dy - shift) * width + (dx - shift)) * channels
+    _shuffle_pixels_kernel(img_3d, shift, codes, deltas)
+    if not np.shares_memory(img_3d, img):
+        img[...] = img_3d.reshape(img.shape)
     return img
@@ -1,6 +1,16 @@
 import cv2
 import numpy as np
 
+# per-severity unsharp masking amount, shared with chain.py
+OVERSHARPEN_AMOUNTS = [2, 2.8, 4, 6, 8]
+# per-severity (detail kept, bilateral sigmaColor, bilateral sigmaSpace) of sharpening_decrease
+SHARPENING_DECREASE_PARAMS = [
+    (0.8, 20, 9),
+    (0.65, 35, 12),
+    (0.5, 50, 16),
+    (0.35, 65, 20),
+    (0.2, 80, 24),
+]
 
 def oversharpen(img, severity=1):
     """OverSharpening filter."""
@@ -8,7 +18,7 @@ def oversharpen(img, severity=1):
     assert img.dtype == np.uint8, "Image array should have dtype of np.uint8"
     assert severity in [1, 2, 3, 4, 5], "Severity must be an integer between 1 and 5."
 
-    amount = [2, 2.8, 4, 6, 8][severity - 1]
+    amount = OVERSHARPEN_AMOUNTS[severity - 1]
     # Create a blurred/smoothed version
     blur_radius = 5
     sigmaX = 0
@@ -23,15 +33,9 @@ def sharpening_decrease(img, severity=1):
     assert severity in [1, 2, 3, 4, 5], "Severity must be an integer between 1 and 5."
 
     # 较大的 severity 表示更强的“去锐化”（更弱的细节）
-    alpha_map = [0.8, 0.65, 0.5, 0.35, 0.2]  # 细节保留比例
-    sigmaC_map = [20, 35, 50, 65, 80]        # 双边滤波颜色域
-    sigmaS_map = [9, 12, 16, 20, 24]         # 双边滤波空间域
+    alpha, sigma_color, sigma_space = SHARPENING_DECREASE_PARAMS[severity - 1]
     d = 9
 
-    alpha = alpha_map[severity - 1]
-    sigma_color = sigmaC_map[severity - 1]
-    sigma_space = sigmaS_map[severity - 1]
-
     img_f = img.astype(np.float32)
     # 双边滤波作为边缘保持的“基底”，能避免简单高斯带来的过度模糊
     base = cv2.bilateralFilter(img_f, d=d, sigmaColor=sigma_color, sigmaSpace=sigma_space)
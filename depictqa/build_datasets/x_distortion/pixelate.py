@@ -1,10 +1,13 @@
 import numpy as np
 from PIL import Image
 
+# per-severity downscaling factor
+PIXELATE_SCALES = [0.5, 0.4, 0.3, 0.25, 0.2]
+
 
 def pixelate(img, severity=1):
     """Pixelate."""
-    scale = [0.5, 0.4, 0.3, 0.25, 0.2][severity - 1]
+    scale = PIXELATE_SCALES[severity - 1]
     h, w = np.array(img).shape[:2]
     img = Image.fromarray(img)
     img = img.resize((int(w * scale), int(h * scale)), Image.BOX)
@@ -0,0 +1,60 @@
+"""Floating-point precision policy of the distortion functions.
+
+The reference functions normalize with np.array(img) / 255.0, so blur_*,
+noise_*, contrast_*_stretch and brightness_*_gamma_* compute on float64
+copies of the image. Under the float32 policy they compute in float32 and move
+half the bytes; outputs then differ from the float64 ones by rounding, bounded
+per category in tests/test_precision.py.
+
+    from x_distortion import precision
+    precision.set_precision("float32")          # global switch
+    with precision.use_precision("float32"):    # scoped, not thread-safe
+        ...
+
+float64 stays the default, it reproduces the released datasets. Functions that
+already work in float32 or uint8 (the LUT and color-space kernels of fused.py,
+saturate_*, *_LAB, oversharpen) are the same under both policies: their LUTs
+are built once per severity, so a fixed-point path would not save any traffic.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+
+PRECISIONS = {"float32": np.float32, "float64": np.float64}
+
+FLOAT_DTYPE = np.float64
+
+
+def set_precision(precision):
+    """Set the global compute dtype, "float32" or "float64"."""
+    global FLOAT_DTYPE
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}, expecting one of {sorted(PRECISIONS)}")
+    FLOAT_DTYPE = PRECISIONS[precision]
+
+
+def get_precision():
+    return np.dtype(FLOAT_DTYPE).name
+
+
+@contextmanager
+def use_precision(precision):
+    previous = get_precision()
+    set_precision(precision)
+    try:
+        yield
+    finally:
+        set_precision(previous)
+
+
+def to_float(img, dtype=None):
+    """img / 255.0 in dtype (the policy dtype if None), without a float64 temporary.
+
+    Equal to np.float32(np.array(img) / 255.0) for dtype=np.float32 and uint8 img.
+    """
+    return np.divide(img, 255.0, dtype=dtype or FLOAT_DTYPE)
+
+
+def as_float(x):
+    """Cast a float64 draw or mask to the policy dtype, no copy under float64."""
+    return x.astype(FLOAT_DTYPE, copy=False)
@@ -2,10 +2,15 @@ import numpy as np
 from PIL import Image
 from skimage.filters import threshold_multiotsu
 
+# per-severity number of levels per channel
+QUANTIZATION_OTSU_CLASSES = [15, 11, 8, 5, 3]
+QUANTIZATION_MEDIAN_COLORS = [20, 15, 10, 6, 3]
+QUANTIZATION_HIST_BINS = [24, 16, 8, 6, 4]
+
 
 def quantization_otsu(img, severity=1):
     """Color quantization using OTSU method."""
-    num_cls = [15, 11, 8, 5, 3][severity - 1]
+    num_cls = QUANTIZATION_OTSU_CLASSES[severity - 1]
     img = np.array(img).astype(np.float32)
     for i in range(img.shape[2]):
         img_gray = img[:, :, i]
@@ -22,7 +27,7 @@ def quantization_otsu(img, severity=1):
 
 def quantization_median(img, severity=1):
     """Color quantization using histogram median."""
-    num_color = [20, 15, 10, 6, 3][severity - 1]
+    num_color = QUANTIZATION_MEDIAN_COLORS[severity - 1]
     for i in range(img.shape[2]):
         img_gray = Image.fromarray(img[:, :, i])
         img_gray = img_gray.quantize(
@@ -35,7 +40,7 @@ def quantization_median(img, severity=1):
 
 def quantization_hist(img, severity=1):
     """Color quantization using histogram equalization."""
-    num_bins = [24, 16, 8, 6, 4][severity - 1]
+    num_bins = QUANTIZATION_HIST_BINS[severity - 1]
     hist, _ = np.histogram(img.flatten(), bins=num_bins, range=[0, 255])
     cdf = hist.cumsum()
     cdf_m = np.ma.masked_equal(cdf, 0)
@@ -0,0 +1,183 @@
+"""Distortion registry built once at import time.
+
+Maps every distortion name to its function, class, category, per-severity
+parameter table and capability flags, so dispatch and metadata lookups are plain dict
+accesses instead of globals() lookups and scans over distortions_dict.
+
+Flags:
+    pointwise: each output pixel only depends on the same input pixel, so the
+        distortion can run on stacked images or tiles without halo
+    spatial: each output pixel depends on a neighbourhood of input pixels
+    stochastic: draws random numbers
+    lutable: has a per-(name, severity) uint8 LUT in fused.py
+    mutates_input: writes into the array it is given
+
+params is the table the distortion function indexes with severity - 1, a list
+of one value or one tuple of values per severity (see the module of each
+table for the meaning of the tuple entries).
+
+Distortions that are neither pointwise nor spatial need whole-image statistics
+or pixel coordinates (e.g. contrast_*_stretch, brightness_vignette).
+"""
+from collections import namedtuple
+from importlib import import_module
+
+from .blur import (
+    BLUR_GAUSSIAN_SIGMAS,
+    BLUR_GLASS_PARAMS,
+    BLUR_JITTER_SHIFTS,
+    BLUR_LENS_RADII,
+    BLUR_LENSMASK_PARAMS,
+    BLUR_MOTION_PARAMS,
+    BLUR_ZOOM_FACTORS,
+)
+from .brightness import VIGNETTE_GAMMAS
+from .compression import JPEG_2000_QUALITIES, JPEG_QUALITIES
+from .contrast import CONTRAST_SCALE_FACTORS
+from .fused import HSV_SHIFT_SPECS, LUT_SPECS, STRETCH_SPECS
+from .noise import (
+    NOISE_CORRELATED_SIGMAS,
+    NOISE_GAUSSIAN_SIGMAS,
+    NOISE_IMPULSE_AMOUNTS,
+    NOISE_POISSON_FACTORS,
+    NOISE_SPECKLE_SCALES,
+    NOISE_YCRCB_PARAMS,
+)
+from .oversharpen import OVERSHARPEN_AMOUNTS, SHARPENING_DECREASE_PARAMS
+from .pixelate import PIXELATE_SCALES
+from .quantization import QUANTIZATION_HIST_BINS, QUANTIZATION_MEDIAN_COLORS, QUANTIZATION_OTSU_CLASSES
+
+DistortionSpec = namedtuple(
+    "DistortionSpec",
+    [
+        "name",
+        "func",
+        "distortion_class",
+        "category",
+        "params",
+        "pointwise",
+        "spatial",
+        "stochastic",
+        "lutable",
+        "mutates_input",
+    ],
+)
+
+# distortions that are not pointwise, by the property that prevents it
+SPATIAL = {
+    "blur_gaussian",
+    "blur_gaussian_lensmask",
+    "blur_motion",
+    "blur_glass",
+    "blur_lens",
+    "blur_zoom",
+    "blur_jitter",
+    "compression_jpeg",
+    "compression_jpeg_2000",
+    "noise_spatially_correlated",
+    "oversharpen",
+    "sharpening_decrease",
+    "pixelate",
+}
+GLOBAL = {
+    "brightness_vignette",
+    "contrast_weaken_scale",
+    "contrast_strengthen_scale",
+    "contrast_weaken_stretch",
+    "contrast_strengthen_stretch",
+    "quantization_otsu",
+    "quantization_median",
+    "quantization_hist",
+}
+STOCHASTIC = {
+    "blur_motion",
+    "blur_glass",
+    "blur_jitter",
+    "noise_gaussian_RGB",
+    "noise_gaussian_YCrCb",
+    "noise_speckle",
+    "noise_spatially_correlated",
+    "noise_poisson",
+    "noise_impulse",
+}
+MUTATES_INPUT = {
+    "quantization_median",
+}
+
+# per-severity parameter tables of the distortions without a fused kernel; the
+# tables of the fused ones are the params of their LUT_SPECS, HSV_SHIFT_SPECS or
+# STRETCH_SPECS entry
+SEVERITY_PARAMS = {
+    "blur_gaussian": BLUR_GAUSSIAN_SIGMAS,
+    "blur_gaussian_lensmask": BLUR_LENSMASK_PARAMS,
+    "blur_motion": BLUR_MOTION_PARAMS,
+    "blur_glass": BLUR_GLASS_PARAMS,
+    "blur_lens": BLUR_LENS_RADII,
+    "blur_zoom": BLUR_ZOOM_FACTORS,
+    "blur_jitter": BLUR_JITTER_SHIFTS,
+    "brightness_vignette": VIGNETTE_GAMMAS,
+    "compression_jpeg": JPEG_QUALITIES,
+    "compression_jpeg_2000": JPEG_2000_QUALITIES,
+    "contrast_weaken_scale": CONTRAST_SCALE_FACTORS["contrast_weaken_scale"],
+    "contrast_strengthen_scale": CONTRAST_SCALE_FACTORS["contrast_strengthen_scale"],
+    "noise_gaussian_RGB": NOISE_GAUSSIAN_SIGMAS,
+    "noise_gaussian_YCrCb": NOISE_YCRCB_PARAMS,
+    "noise_speckle": NOISE_SPECKLE_SCALES,
+    "noise_spatially_correlated": NOISE_CORRELATED_SIGMAS,
+    "noise_poisson": NOISE_POISSON_FACTORS,
+    "noise_impulse": NOISE_IMPULSE_AMOUNTS,
+    "oversharpen": OVERSHARPEN_AMOUNTS,
+    "sharpening_decrease": SHARPENING_DECREASE_PARAMS,
+    "pixelate": PIXELATE_SCALES,
+    "quantization_otsu": QUANTIZATION_OTSU_CLASSES,
+    "quantization_median": QUANTIZATION_MEDIAN_COLORS,
+    "quantization_hist": QUANTIZATION_HIST_BINS,
+}
+
+
+def _get_params(name):
+    if name in LUT_SPECS:
+        return LUT_SPECS[name][2]
+    if name in HSV_SHIFT_SPECS:
+        return HSV_SHIFT_SPECS[name]
+    if name in STRETCH_SPECS:
+        return STRETCH_SPECS[name]
+    return SEVERITY_PARAMS.get(name)
+
+
+def build_registry(module_names, distortions_dict):
+    """Collect the public functions of the distortion modules into a name -> DistortionSpec dict.
+
+    @param module_names (list): x_distortion submodules, the module name is the category
+    @param distortions_dict (dict): distortion class -> list of distortion names
+    """
+    name_to_class = {
+        name: distortion_class
+        for distortion_class, names in distortions_dict.items()
+        for name in names
+    }
+    registry = {}
+    for category in module_names:
+        # by name, since the package attributes oversharpen/pixelate are the functions
+        module = import_module(f"{__package__}.{category}")
+        for name, func in vars(module).items():
+            if name.startswith("_") or not callable(func):
+                continue
+            if getattr(func, "__module__", None) != module.__name__:
+                continue
+            registry[name] = DistortionSpec(
+                name=name,
+                func=func,
+                distortion_class=name_to_class.get(name),
+                category=category,
+                params=_get_params(name),
+                pointwise=name not in SPATIAL and name not in GLOBAL,
+                spatial=name in SPATIAL,
+                stochastic=name in STOCHASTIC,
+                lutable=name in LUT_SPECS,
+                mutates_input=name in MUTATES_INPUT,
+            )
+    missing = set(name_to_class) - set(registry)
+    if missing:
+        raise ValueError(f"distortions_dict names without a function: {sorted(missing)}")
+    return registry
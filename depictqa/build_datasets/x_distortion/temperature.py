@@ -1,13 +1,20 @@
 import cv2
 import numpy as np
 
+from .precision import to_float
+
+# per-severity parameters, shared with the fused kernels in fused.py
+TEMPERATURE_UP_FACTORS=[1.08,1.15,1.23,1.32,1.42]
+TEMPERATURE_DOWN_FACTORS=[0.92,0.85,0.77,0.68,0.58]
+TEMPERATURE_SHIFTS_LAB=[5,10,15,20,25]
+
 def temperature_warm_RGB(img,severity=1):
     # Red channel increase
     # Blue channel decrease
-    red_factor=[1.08,1.15,1.23,1.32,1.42][severity-1]
-    blue_factor=[0.92,0.85,0.77,0.68,0.58][severity-1]
+    red_factor=TEMPERATURE_UP_FACTORS[severity-1]
+    blue_factor=TEMPERATURE_DOWN_FACTORS[severity-1]
 
-    img = np.float32(np.array(img) / 255.0)
+    img = to_float(img, np.float32)
     # adjust RGB channels
     img[:,:,0]=img[:,:,0]*red_factor # red channel
     img[:,:,2]=img[:,:,2]*blue_factor # blue channel
@@ -19,10 +26,10 @@ def temperature_warm_RGB(img,severity=1):
 def temperature_cool_RGB(img,severity=1):
     # Red channel decrease
     # Blue channel increase
-    red_factor=[0.92,0.85,0.77,0.68,0.58][severity-1]
-    blue_factor=[1.08,1.15,1.23,1.32,1.42][severity-1]
+    red_factor=TEMPERATURE_DOWN_FACTORS[severity-1]
+    blue_factor=TEMPERATURE_UP_FACTORS[severity-1]
 
-    img = np.float32(np.array(img) / 255.0)
+    img = to_float(img, np.float32)
     # adjust RGB channels
     img[:,:,0]=img[:,:,0]*red_factor # red channel
     img[:,:,2]=img[:,:,2]*blue_factor # blue channel
@@ -33,7 +40,7 @@ def temperature_cool_RGB(img,severity=1):
 def temperature_warm_LAB(img,severity=1):
     # In LAB space, B channel represents blue-yellow axis
     # Positive B = yellow, Negative B = blue
-    b_shift=[5,10,15,20,25][severity-1]
+    b_shift=TEMPERATURE_SHIFTS_LAB[severity-1]
 
     img_lab=cv2.cvtColor(img,cv2.COLOR_RGB2LAB)
     img_lab=img_lab.astype(np.float32)
@@ -49,7 +56,7 @@ def temperature_warm_LAB(img,severity=1):
 def temperature_cool_LAB(img,severity=1):
     # In LAB space, B channel represents blue-yellow axis
     # Positive B = yellow, Negative B = blue
-    b_shift=[-5,-10,-15,-20,-25][severity-1]
+    b_shift=-TEMPERATURE_SHIFTS_LAB[severity-1]
 
     img_lab=cv2.cvtColor(img,cv2.COLOR_RGB2LAB)
     img_lab=img_lab.astype(np.float32)
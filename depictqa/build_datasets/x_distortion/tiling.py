@@ -0,0 +1,196 @@
+"""Tiled execution of distortions on references larger than memory.
+
+add_distortion works on an in-memory image and most distortions allocate
+several float64 temporaries of its size, so a 50 MP reference needs a few GB.
+tiled_distortion reads the source in tiles grown by a halo (the support radius
+of the distortion), distorts every tile through add_distortion and writes its
+inner part to the output, so peak memory depends on tile_size, not on the
+image size. Source and output may be np.memmap (np.load(path, mmap_mode="r"),
+open_output_memmap) or any array-like that supports 2-D slicing.
+
+Supported distortions and how close they are to add_distortion on the whole
+image (with the same np.random state):
+
+    pointwise: no halo, identical
+    HALO (fixed-support spatial): identical for blur_gaussian and oversharpen,
+        max abs diff 1 for blur_lens, blur_motion and sharpening_decrease,
+        whose OpenCV filters round differently with the image size and range
+    TWO_PASS (contrast_*): the whole-image statistic is accumulated over the
+        tiles first, then applied per tile, identical to the fused kernels
+
+blur_motion draws one angle per image: every tile restarts from the same
+random state (np.random or rng), so all tiles share it. The other stochastic
+distortions draw per-pixel noise: each tile is seeded from one draw of the
+random state and its tile index, so the output follows the distribution of
+add_distortion but is not equal to it.
+
+Position-dependent or whole-image distortions (blur_zoom, blur_gaussian_lensmask,
+brightness_vignette, compression_*, pixelate, quantization_*) are not tileable.
+"""
+import copy
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from . import DISTORTIONS, add_distortion
+from .contrast import CONTRAST_SCALE_FACTORS
+from .fused import STRETCH_SPECS, stretch_lut
+
+# distortion_name -> support radius in pixels per severity, keep in sync with the parameter tables
+HALO = {
+    # skimage gaussian truncates at 4 sigma
+    "blur_gaussian": [4, 8, 12, 16, 20],
+    # two gaussians and iteration shuffles of up to shift pixels in between
+    "blur_glass": [7, 10, 14, 18, 20],
+    # gen_disk radius
+    "blur_lens": [2, 3, 4, 6, 8],
+    "blur_jitter": [1, 2, 3, 4, 5],
+    # the line kernel spans 2 * radius pixels
+    "blur_motion": [10, 20, 30, 30, 40],
+    # 3 x 3 box filter of the noise
+    "noise_spatially_correlated": [1, 1, 1, 1, 1],
+    # 5 x 5 Gaussian
+    "oversharpen": [2, 2, 2, 2, 2],
+    # bilateral filter with d = 9
+    "sharpening_decrease": [4, 4, 4, 4, 4],
+}
+# stochastic distortions whose draws are per image, not per pixel
+SHARED_DRAWS = {"blur_motion"}
+
+
+def _channel_sums(tile):
+    return np.array(cv2.sumElems(tile)[:3])
+
+
+def _gray_sum(tile):
+    return np.asarray(Image.fromarray(tile).convert("L")).sum(dtype=np.int64)
+
+
+def _apply_stretch(tile, severity, distortion_name, sums, num_pixels):
+    factor = STRETCH_SPECS[distortion_name][severity - 1]
+    return cv2.LUT(tile, stretch_lut(sums, num_pixels, factor))
+
+
+def _apply_contrast_scale(tile, severity, distortion_name, gray_sum, num_pixels):
+    # ImageEnhance.Contrast blends with a gray image at the rounded mean luminance
+    factor = CONTRAST_SCALE_FACTORS[distortion_name][severity - 1]
+    mean = int(gray_sum / num_pixels + 0.5)
+    img = Image.fromarray(tile)
+    degenerate = Image.new("L", img.size, mean).convert(img.mode)
+    return np.array(Image.blend(degenerate, img, factor))
+
+
+# distortion_name -> (per-tile statistic summed over the tiles, apply(tile, severity, name, total, num_pixels))
+TWO_PASS = {
+    **{name: (_channel_sums, _apply_stretch) for name in STRETCH_SPECS},
+    **{name: (_gray_sum, _apply_contrast_scale) for name in CONTRAST_SCALE_FACTORS},
+}
+
+
+def tile_halo(distortion_name, severity=5):
+    """Halo in pixels a tile of distortion_name needs, None if it is not tileable."""
+    if distortion_name in HALO:
+        return HALO[distortion_name][severity - 1]
+    if distortion_name in TWO_PASS or DISTORTIONS[distortion_name].pointwise:
+        return 0
+    return None
+
+
+def is_tileable(distortion_name):
+    return distortion_name in DISTORTIONS and tile_halo(distortion_name) is not None
+
+
+def open_output_memmap(path, shape):
+    """uint8 .npy memmap for the output of tiled_distortion, H x W x 3."""
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=tuple(shape))
+
+
+def _spans(length, tile_size):
+    """[start, end) spans of at most tile_size, the last one merged if shorter than 32."""
+    starts = list(range(0, length, tile_size))
+    if len(starts) > 1 and length - starts[-1] < 32:
+        starts.pop()
+    return list(zip(starts, starts[1:] + [length]))
+
+
+def iter_tiles(shape, tile_size, halo):
+    """Yield (inner, outer) tiles as (y0, y1, x0, x1), outer is inner grown by halo and clipped to the image."""
+    h, w = shape[:2]
+    for y0, y1 in _spans(h, tile_size):
+        for x0, x1 in _spans(w, tile_size):
+            yield (y0, y1, x0, x1), (max(y0 - halo, 0), min(y1 + halo, h), max(x0 - halo, 0), min(x1 + halo, w))
+
+
+def tiled_distortion(img, severity, distortion_name, out=None, tile_size=1024, rng=None):
+    """This function distorts a large image tile by tile.
+
+    @param img (array-like, uint8): input image, H x W x 3, RGB, [0, 255], e.g.
+        np.memmap, only tile_size + 2 * halo rows and columns are read at once
+    @param severity (int): severity of distortion, [1, 5]
+    @param distortion_name (str): distortion name, see is_tileable
+    @param out (array-like, uint8): optional output, H x W x 3, e.g. from
+        open_output_memmap, in-memory np.ndarray if None
+    @param tile_size (int): side of the inner tiles, >= 32
+    @param rng (np.random.Generator | int | None): random source of the
+        stochastic distortions, None draws from the global np.random state
+    @return: out with the distorted image
+    """
+    if distortion_name not in DISTORTIONS:
+        raise ValueError(f"Unknown distortion_name: {distortion_name}")
+    if not is_tileable(distortion_name):
+        raise ValueError(f"{distortion_name} is not tileable, it depends on the whole image or pixel positions")
+    if severity not in [1, 2, 3, 4, 5]:
+        raise AttributeError('The severity must be an integer in [1, 5]')
+    if len(img.shape) != 3 or img.shape[2] != 3 or np.dtype(img.dtype) != np.uint8:
+        raise AttributeError('Expecting img to be uint8 with shape (h x w x 3)')
+    h, w = img.shape[:2]
+    if h < 32 or w < 32:
+        raise AttributeError('The (w, h) must be at least 32 pixels')
+    if tile_size < 32:
+        raise AttributeError('The tile_size must be at least 32 pixels')
+    if out is None:
+        out = np.empty((h, w, 3), dtype=np.uint8)
+    elif tuple(out.shape) != (h, w, 3):
+        raise AttributeError(f'Expecting out.shape to be {(h, w, 3)}, got {tuple(out.shape)}')
+
+    halo = tile_halo(distortion_name, severity)
+    tiles = list(iter_tiles(img.shape, tile_size, halo))
+    if distortion_name in TWO_PASS:
+        statistic, apply = TWO_PASS[distortion_name]
+        total = sum(statistic(np.ascontiguousarray(img[y0:y1, x0:x1])) for (y0, y1, x0, x1), _ in tiles)
+        for (y0, y1, x0, x1), _ in tiles:
+            tile = np.ascontiguousarray(img[y0:y1, x0:x1])
+            out[y0:y1, x0:x1] = apply(tile, severity, distortion_name, total, h * w)
+        return out
+
+    stochastic = DISTORTIONS[distortion_name].stochastic
+    shared = distortion_name in SHARED_DRAWS
+    if stochastic and rng is not None:
+        rng = np.random.default_rng(rng)
+        if not shared:
+            base_seed = int(rng.integers(2**31))
+    elif stochastic:
+        state = np.random.get_state()
+        if not shared:
+            base_seed = np.random.randint(2**31)
+            state = np.random.get_state()
+    tile_rng = None
+    for index, ((y0, y1, x0, x1), (oy0, oy1, ox0, ox1)) in enumerate(tiles):
+        if stochastic and rng is not None:
+            # every tile of a shared draw starts from the caller's generator state
+            tile_rng = copy.deepcopy(rng) if shared else np.random.default_rng([base_seed, index])
+        elif stochastic and shared:
+            np.random.set_state(state)
+        elif stochastic:
+            np.random.seed(np.random.SeedSequence([base_seed, index]).generate_state(1))
+        tile = np.ascontiguousarray(img[oy0:oy1, ox0:ox1])
+        tile_lq = add_distortion(tile, severity=severity, distortion_name=distortion_name, rng=tile_rng)
+        out[y0:y1, x0:x1] = tile_lq[y0 - oy0 : y1 - oy0, x0 - ox0 : x1 - ox0]
+    if stochastic and rng is not None and shared:
+        # leave the generator where one add_distortion call would
+        rng.bit_generator.state = tile_rng.bit_generator.state
+    elif stochastic and rng is None and not shared:
+        # the per-tile seeds replaced the global state, continue after the base seed draw
+        np.random.set_state(state)
+    return out
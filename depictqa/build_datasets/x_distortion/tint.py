@@ -1,11 +1,16 @@
 import cv2
 import numpy as np
 
+# per-severity parameters, shared with the fused kernels in fused.py
+TINT_UP_FACTORS=[1.08,1.15,1.23,1.32,1.42]
+TINT_DOWN_FACTORS=[0.92,0.85,0.77,0.68,0.58]
+TINT_SHIFTS_LAB=[5,10,15,20,25]
+
 def tint_green_RGB(img, severity=1):
     # Green channel increase
     # Red channel decrease
-    green_factor=[1.08,1.15,1.23,1.32,1.42][severity-1]
-    red_factor=[0.92,0.85,0.77,0.68,0.58][severity-1]
+    green_factor=TINT_UP_FACTORS[severity-1]
+    red_factor=TINT_DOWN_FACTORS[severity-1]
 
     img=np.array(img,dtype=np.float32)/255.0
 
@@ -20,8 +25,8 @@ def tint_green_RGB(img, severity=1):
 def tint_magenta_RGB(img, severity=1):
     # Red channel increase
     # Green channel decrease
-    red_factor=[1.08,1.15,1.23,1.32,1.42][severity-1]
-    green_factor=[0.92,0.85,0.77,0.68,0.58][severity-1]
+    red_factor=TINT_UP_FACTORS[severity-1]
+    green_factor=TINT_DOWN_FACTORS[severity-1]
 
     img=np.array(img,dtype=np.float32)/255.0
 
@@ -37,7 +42,7 @@ def tint_green_LAB(img, severity=1):
     # A channel shift to green
     # In LAB space, A channel represents green-magenta axis
     # Positive A = magenta, Negative A = green
-    a_shift=[-5,-10,-15,-20,-25][severity-1]
+    a_shift=-TINT_SHIFTS_LAB[severity-1]
 
     img_lab=cv2.cvtColor(img,cv2.COLOR_RGB2LAB)
     img_lab=img_lab.astype(np.float32)
@@ -54,7 +59,7 @@ def tint_magenta_LAB(img, severity=1):
     # A channel shift to magenta
     # In LAB space, A channel represents green-magenta axis
     # Positive A = magenta, Negative A = green
-    a_shift=[5,10,15,20,25][severity-1]
+    a_shift=TINT_SHIFTS_LAB[severity-1]
 
     img_lab=cv2.cvtColor(img,cv2.COLOR_RGB2LAB)
     img_lab=img_lab.astype(np.float32)
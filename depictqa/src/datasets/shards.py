@@ -0,0 +1,12 @@
+"""Reader for images stored in the tar shards of the distortion scripts.
+
+The shards and their {shard}.idx.jsonl member index are written by
+utils/tar_shards.py; meta files address such images as
+"<shard path>::<member name>". The reader is the one of utils/tar_shards.py,
+which reloads the index of a shard that grew since it was cached.
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../../utils"))
+from tar_shards import SHARD_SEP, has_member, load_shard_index, open_image, read_member  # noqa: E402
@@ -4,11 +4,12 @@ import os
 import torch
 import torch.nn as nn
 from peft import LoraConfig, TaskType, get_peft_model
-from PIL import Image, ImageFile
+from PIL import ImageFile
 from sentence_transformers import SentenceTransformer
 from torch.nn.utils import rnn
 from transformers import LlamaTokenizer, StoppingCriteriaList
 
+from datasets.shards import open_image
 from model.conversations import conversation_dict, system_dict
 
 from .clip import build_abstractor, load_clip
@@ -109,7 +110,7 @@ class DepictQA(nn.Module):
             num_max_try = 5
             for _ in range(num_max_try):
                 try:
-                    img = Image.open(img_path).convert("RGB")
+                    img = open_image(img_path).convert("RGB")
                     img = self.vision_preprocess(img).to(device)  # [1, 3, H, W]
                     break
                 except:
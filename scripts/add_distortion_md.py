@@ -1,25 +1,31 @@
+import os
 import json
+import functools
 import random
 import sys
 import argparse
-from PIL import Image, ImageFile
+from PIL import ImageFile
 from pathlib import Path
 
-import numpy as np
-from PIL import Image, ImageFile
-
 sys.path.append("/home/dzc/yuanhao/syn_aes_data/utils")
 sys.path.append("/home/dzc/yuanhao/syn_aes_data/DepictQA")
 sys.path.append("/home/dzc/yuanhao/syn_aes_data/DepictQA/build_datasets")
 from constant import CATEGORY_TO_CLASSES
 from tool import (
     seed_everything,
+    derive_seed,
     get_category_from_class,
     get_distortion_name,
-    is_distortion_classes_duplicate,
 )
+from meta_store import open_meta_store
+from image_writer import SAVE_FORMATS, ImageWriter
+from image_source import iter_decoded, open_image_source
+from tar_shards import ShardWriter
+from artifact_cache import ArtifactCache, file_digest
+from resume_manifest import ResumeManifest
+from chain_sampler import ChainSampler, canonical_chain
 from build_datasets.scripts.constants_md import multi_distortions_dict
-from build_datasets.x_distortion import add_distortion, distortions_dict
+from build_datasets.x_distortion import DISTORTIONS, apply_chain, distortions_dict, precision
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
@@ -28,7 +34,12 @@ parser.add_argument(
     "--reference_dir",
     type=str,
     required=True,
-    help="Path to the reference image",
+    help="Reference images: a directory, a .txt/.lst file list, tar/WebDataset shards (glob allowed) or a .zip",
+)
+parser.add_argument(
+    "--recursive",
+    action="store_true",
+    help="Also read the images in the subdirectories of reference_dir",
 )
 parser.add_argument(
     "--distortion_dir",
@@ -62,49 +73,103 @@ parser.add_argument(
     required=True,
     help="Path to save the meta json file",
 )
+parser.add_argument(
+    "--float_chain",
+    action="store_true",
+    help="Run each chain on one float32 buffer instead of quantizing after every distortion (faster); "
+    "differs from the step-by-step outputs by a mean abs diff <= 4 levels, up to 127 on near-black pixels",
+)
+parser.add_argument(
+    "--decode_threads",
+    type=int,
+    default=2,
+    help="Threads decoding the next references ahead of the distortions",
+)
+parser.add_argument(
+    "--save_format",
+    type=str,
+    default=None,
+    choices=sorted(SAVE_FORMATS),
+    help="Format of the distorted images, defaults to the format of each reference",
+)
+parser.add_argument(
+    "--png_compress_level",
+    type=int,
+    default=None,
+    help="zlib level in [0, 9] for PNG outputs, lower is faster and larger",
+)
+parser.add_argument(
+    "--jpeg_quality",
+    type=int,
+    default=None,
+    help="Quality in [1, 95] for JPEG outputs",
+)
+parser.add_argument(
+    "--webp_lossless",
+    action="store_true",
+    help="Encode WebP outputs losslessly",
+)
+parser.add_argument(
+    "--tar_shards",
+    action="store_true",
+    help="Write size-bounded tar shards (reference, samples, per-sample json) instead of one file per sample",
+)
+parser.add_argument(
+    "--shard_max_mb",
+    type=int,
+    default=1024,
+    help="Size above which the next tar shard is started",
+)
+parser.add_argument(
+    "--dedup_cache",
+    type=str,
+    default=None,
+    help="Directory of a content-addressed cache shared between runs; identical (reference, recipe) "
+    "outputs are hard-linked instead of regenerated. Clear it when the distortion code changes",
+)
+parser.add_argument(
+    "--precision",
+    type=str,
+    default="float64",
+    choices=sorted(precision.PRECISIONS),
+    help="Float dtype of the distortion functions, float32 halves their memory traffic, see x_distortion/precision.py",
+)
+parser.add_argument(
+    "--writer_threads",
+    type=int,
+    default=2,
+    help="Encoder threads, 0 encodes on the distortion thread",
+)
+parser.add_argument(
+    "--max_pending_writes",
+    type=int,
+    default=16,
+    help="Distorted images queued for encoding before the distortion thread waits",
+)
 
-def select_samples(num_distortions, excluded_categories=None):
-    all_classes = []
-    for classes_in_category in CATEGORY_TO_CLASSES.values():
-        for distortion_class in classes_in_category:
-            all_classes.append(distortion_class)
-    available_classes = list(dict.fromkeys(all_classes))
-
-    if num_distortions == 1:
-        print("Only support num_distortions > 1.")
-        return
-
-    if excluded_categories:
-        candidate_classes = [
-            cls
-            for category, classes in CATEGORY_TO_CLASSES.items()
-            if category not in excluded_categories
-            for cls in classes
-            if cls in available_classes
-        ]
-        first_class = random.choice(candidate_classes) if candidate_classes else random.choice(available_classes)
-    else:
-        first_class = random.choice(available_classes)
-
-    selected_classes = [first_class]
-    for _ in range(num_distortions - 1):
-        last_class = selected_classes[-1]
-        if last_class in multi_distortions_dict:
-            compatible_classes = [
-                c
-                for c in multi_distortions_dict[last_class]
-                if c in distortions_dict and c in available_classes and c not in selected_classes
-            ]
-            if compatible_classes:
-                next_class = random.choice(compatible_classes)
-            else:
-                remaining = [c for c in available_classes if c not in selected_classes]
-                next_class = random.choice(remaining) if remaining else random.choice(available_classes)
-        else:
-            remaining = [c for c in available_classes if c not in selected_classes]
-            next_class = random.choice(remaining) if remaining else random.choice(available_classes)
-        selected_classes.append(next_class)
-    return selected_classes
+def is_generated(record, summary_data, manifest=None):
+    """True if the meta has an entry for the reference whose files are all written.
+
+    @param manifest (ResumeManifest): written files, None for tar shards, whose
+        group is written before its meta entry
+    """
+    existing_entry = summary_data.get(record.name)
+    if not existing_entry:
+        return False
+    distortions_complete = manifest is None or all(
+        os.path.basename(distortion["img_lq"]) in manifest
+        for distortion in existing_entry.get("distortions", [])
+    )
+    if distortions_complete:
+        print(f"{record.path} has been generated, skip.")
+    return distortions_complete
+
+
+def on_written(manifest, cache, cache_key, save_path):
+    """Writer callback: record the written file, and cache it only now that it is complete."""
+    manifest.add(save_path)
+    if cache_key:
+        cache.put(cache_key, save_path)
 
 
 if __name__ == "__main__":
@@ -112,124 +177,181 @@ if __name__ == "__main__":
     num_severity = 5
     resize = 768
     seed_everything(seed=args.seed)
+    precision.set_precision(args.precision)
+    try:
+        chain_sampler = ChainSampler(
+            CATEGORY_TO_CLASSES, multi_distortions_dict, args.num_multi_distortions, known_classes=distortions_dict
+        )
+    except ValueError as e:
+        parser.error(str(e))
 
-    reference_dir = Path(args.reference_dir)
-    img_types = ["*.png", "*.jpg", "*.jpeg", "*.webp"]
-    img_paths = []
-    for img_type in img_types:
-        img_paths.extend(sorted(reference_dir.glob(img_type)))
+    # listed in full, the shuffle below drives the sampling order
+    records = list(open_image_source(args.reference_dir, recursive=args.recursive))
 
-    print(f"Total images to process: {len(img_paths)}")
-    random.shuffle(img_paths)
+    print(f"Total images to process: {len(records)}")
+    random.shuffle(records)
 
     distortion_dir = Path(args.distortion_dir)
     distortion_dir.mkdir(parents=True, exist_ok=True)
     meta_path = Path(args.json_path)
     if meta_path.suffix != ".json":
         meta_path = meta_path / "meta.json"
-    summary_data = {}
-    if meta_path.exists():
-        with open(meta_path, "r") as f:
-            summary_data = json.load(f)
+    summary_data = open_meta_store(str(meta_path))
+    # encodes in the background while the next samples are distorted
+    writer = ImageWriter(
+        num_threads=args.writer_threads,
+        max_pending=args.max_pending_writes,
+        save_format=args.save_format,
+        png_compress_level=args.png_compress_level,
+        jpeg_quality=args.jpeg_quality,
+        webp_lossless=args.webp_lossless,
+    )
+    shard_writer = ShardWriter(distortion_dir, max_bytes=args.shard_max_mb << 20) if args.tar_shards else None
+    cache = ArtifactCache(args.dedup_cache) if args.dedup_cache else None
+    manifest = None
+    if not args.tar_shards:
+        # one manifest per output directory, shared by every run (meta, seed) writing into it
+        manifest = ResumeManifest(str(distortion_dir / "manifest.done"))
+        if manifest.created and len(summary_data):
+            # runs started before the manifest existed are checked on disk once
+            for _, entry in summary_data.items():
+                for distortion in entry.get("distortions", []):
+                    if os.path.exists(distortion["img_lq"]):
+                        manifest.add(distortion["img_lq"])
+    if len(summary_data):
         print(f"Loaded existing summary with {len(summary_data)} entries")
 
-    for idx_ref, img_path in enumerate(img_paths):
+    pending = (
+        record
+        for record in records
+        if not is_generated(record, summary_data, manifest)
+    )
+    # the next references are decoded in the background, each one once and read-only
+    for idx_ref, (record, img) in enumerate(iter_decoded(pending, resize, num_threads=args.decode_threads)):
         print("=" * 100)
-        print(f"Processing image {idx_ref + 1}/{len(img_paths)}: {img_path.name}")
-
-        img_name = img_path.stem
-        img_ext = img_path.suffix or ".png"
-        existing_entry = summary_data.get(img_name)
-        if existing_entry:
-            expected = existing_entry.get("distortion_num", 0)
-            distortions_complete = all(
-                (distortion_dir / f"{img_name}_{i}{img_ext}").exists()
-                for i in range(expected)
-            )
-            if distortions_complete:
-                print(f"{img_path} has been generated, skip.")
-                continue
+        print(f"Processing image {idx_ref + 1}/{len(records)}: {os.path.basename(record.path)}")
 
+        img_path = record.path
+        img_name = record.name
+        img_ext = writer.output_ext(os.path.splitext(img_path)[1] or ".png")
+
+        # chains and severities only depend on (seed, reference), the pixel draws on (seed, reference, idx),
+        # so the output does not depend on the processing order or on earlier references
+        ref_random = random.Random(derive_seed(args.seed, img_name))
         used_categories = set()
+        used_chains = set()
         distortions_list = []
+        ref_name = f"{img_name}.ref{img_ext}"
+        members = [(ref_name, writer.encode(img, ref_name))] if args.tar_shards else None
+        ref_digest = file_digest(img_path, record.data) if cache else None
+        # (cache key, member name) of the new tar members, cached once the group is written
+        new_members = []
 
         for img_idx in range(args.num_distortion_images):
-            idx = 0
-            while True:
-                save_path = distortion_dir / f"{img_name}_{idx}{img_ext}"
-                if not save_path.exists():
-                    break
-                idx += 1
-
-            distortion_entry = None
-            max_retries = 50
-            for _ in range(max_retries):
-                distortion_classes = select_samples(
-                    args.num_multi_distortions, excluded_categories=used_categories
-                )
-                if distortion_classes is None:
-                    continue
-                if is_distortion_classes_duplicate(distortion_classes, distortions_list):
-                    continue
-
-                first_class = (
-                    distortion_classes[0] if isinstance(distortion_classes, list) else distortion_classes
-                )
-                category = get_category_from_class(first_class)
-                if category:
-                    used_categories.add(category)
-
-                img = Image.open(img_path).convert("RGB")
-                h, w = img.height, img.width
-                if resize < min(h, w):
-                    ratio = resize / min(h, w)
-                    h_new, w_new = round(h * ratio), round(w * ratio)
-                    img = img.resize((w_new, h_new), resample=Image.Resampling.BICUBIC)
-                img_lq = np.array(img)
-
-                severities = []
-                distortion_order_name = {}
-                distortion_classes_list = (
-                    distortion_classes if isinstance(distortion_classes, list) else [distortion_classes]
-                )
-                for order_idx, distortion_class in enumerate(distortion_classes_list):
-                    sampled_distortion = get_distortion_name(distortion_class)
-                    severity = random.randint(1, num_severity)
-                    severities.append(severity)
-                    distortion_order_name[sampled_distortion] = order_idx
-                    img_lq = add_distortion(
-                        img_lq, severity=severity, distortion_name=sampled_distortion
-                    )
-
-                Image.fromarray(img_lq).save(save_path)
-                distortion_entry = {
-                    "distortion_classes": distortion_classes_list,
-                    "distortion_order_name": distortion_order_name,
-                    "severities": severities,
-                    "img_lq": str(save_path),
-                }
+            if args.tar_shards:
+                idx = len(distortions_list)
+                save_path = f"{img_name}_{idx}{img_ext}"
+            else:
+                # files of earlier runs are in the manifest, this run's may still be queued;
+                # a name the manifest does not know is checked on disk once, it may come
+                # from a concurrent run or from a run that predates the manifest
+                idx = 0
+                while True:
+                    save_path = distortion_dir / f"{img_name}_{idx}{img_ext}"
+                    if (
+                        save_path.name not in manifest
+                        and not writer.is_pending(save_path)
+                        and not save_path.exists()
+                    ):
+                        break
+                    idx += 1
+
+            distortion_classes = chain_sampler.sample(used_categories, used_chains, rng=ref_random)
+            if distortion_classes is None:
+                print(f"Warning: every distortion chain is used for {img_name}, stop at {len(distortions_list)}.")
                 break
+            used_chains.add(canonical_chain(distortion_classes))
+
+            category = get_category_from_class(distortion_classes[0])
+            if category:
+                used_categories.add(category)
 
-            if distortion_entry is None:
-                print(
-                    f"Warning: After {max_retries} retries, failed to generate unique distortion for {img_name}_{idx}."
-                )
-                continue
+            severities = []
+            distortion_order_name = {}
+            steps = []
+            for order_idx, distortion_class in enumerate(distortion_classes):
+                sampled_distortion = get_distortion_name(distortion_class, rng=ref_random)
+                severity = ref_random.randint(1, num_severity)
+                severities.append(severity)
+                distortion_order_name[sampled_distortion] = order_idx
+                steps.append((sampled_distortion, severity))
+
+            sample_seed = derive_seed(args.seed, img_name, idx)
+            cache_key = cached = None
+            if cache:
+                recipe = {
+                    "steps": steps,
+                    "legacy_quantization": not args.float_chain,
+                    "precision": args.precision,
+                    "resize": resize,
+                    "save_kwargs": writer.save_kwargs(save_path),
+                    "ext": img_ext,
+                }
+                if any(DISTORTIONS[name].stochastic for name, _ in steps):
+                    recipe["sample_seed"] = sample_seed
+                cache_key = cache.key(ref_digest, recipe)
+                cached = cache.get(cache_key)
+            if cached is None:
+                img_lq = apply_chain(img, steps, legacy=not args.float_chain, rng=sample_seed)
+
+            distortion_entry = {
+                "distortion_classes": distortion_classes,
+                "distortion_order_name": distortion_order_name,
+                "severities": severities,
+                "img_lq": str(save_path),
+            }
+            if args.tar_shards:
+                sample_json = json.dumps(dict(distortion_entry, reference=ref_name, source_path=img_path))
+                if cached:
+                    members.append((save_path, cache.read(cached)))
+                else:
+                    members.append((save_path, writer.encode(img_lq, save_path)))
+                    if cache_key:
+                        new_members.append((cache_key, save_path))
+                members.append((f"{img_name}_{idx}.json", sample_json.encode("utf-8")))
+            elif cached:
+                cache.link(cached, save_path)
+                manifest.add(save_path)
+            else:
+                writer.submit(img_lq, save_path, on_written=functools.partial(on_written, manifest, cache, cache_key))
 
             distortions_list.append(distortion_entry)
 
         if distortions_list:
-            summary_data[img_name] = {
-                "img_path": str(img_path),
+            entry = {
+                "img_path": img_path,
                 "distortion_num": len(distortions_list),
                 "distortions": distortions_list,
             }
+            if args.tar_shards:
+                # written before the meta entry, so a resumed run regenerates an unwritten group
+                paths = shard_writer.write_group(members)
+                entry["img_path"] = paths[ref_name]
+                entry["source_path"] = img_path
+                for distortion_entry in distortions_list:
+                    distortion_entry["img_lq"] = paths[distortion_entry["img_lq"]]
+                for cache_key, name in new_members:
+                    cache.put(cache_key, paths[name])
+            summary_data.put(img_name, entry)
 
-        meta_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(meta_path, "w") as f:
-            json.dump(summary_data, f, indent=4)
-
-    meta_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(meta_path, "w") as f:
-        json.dump(summary_data, f, indent=4)
+    writer.close()
+    if manifest is not None:
+        manifest.close()
+    if cache:
+        cache.close()
+        print(f"Dedup cache: {cache.hits} hits, {cache.misses} misses")
+    if shard_writer:
+        shard_writer.close()
+    summary_data.close()
+    summary_data.export(str(meta_path))
     print(f"\nFinal summary saved with {len(summary_data)} entries")
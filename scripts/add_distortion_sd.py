@@ -2,33 +2,42 @@
 import os
 import glob
 import json
-import random
 import argparse
-import numpy as np
-from PIL import Image, ImageFile
+import functools
+from collections import deque
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+from PIL import ImageFile
 import sys
 sys.path.append("/home/dzc/yuanhao/syn_aes_data/utils")
 sys.path.append("/home/dzc/yuanhao/syn_aes_data/DepictQA")
 
-from constant import DIST_DICT, CATEGORY_TO_CLASSES
-from tool import (
-    get_category_from_class,
-    get_distortion_class,
-    save_json_append,
-    seed_everything,
-    weighted_sample_without_replacement,
-    CATEGORY_WEIGHTS
-)
-from build_datasets.x_distortion import add_distortion
+from tool import seed_everything
+from meta_store import open_meta_store, load_meta
+from ref_cache import ReferenceCache
+from image_writer import SAVE_FORMATS, ImageWriter
+from image_source import iter_decoded, open_image_source
+from tar_shards import ShardWriter
+from recipe_plan import group_plan, load_plan, plan_recipes, plan_summary, save_plan
+from build_datasets.x_distortion import add_distortion, precision
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
+# one per worker process; each reference is processed once, keep only the current one
+REF_CACHE = ReferenceCache(max_bytes=0)
+# one per worker process, set by init_writer
+WRITER = None
 
 parser = argparse.ArgumentParser(description="Adding Distortion to the Reference Image")
 parser.add_argument(
     "--reference_dir",
     type=str,
     required=True,
-    help="Path to the reference image",
+    help="Reference images: a directory, a .txt/.lst file list, tar/WebDataset shards (glob allowed) or a .zip",
+)
+parser.add_argument(
+    "--recursive",
+    action="store_true",
+    help="Also read the images in the subdirectories of reference_dir",
 )
 parser.add_argument(
     "--distortion_dir",
@@ -55,135 +64,334 @@ parser.add_argument(
     required=True,
     help="Path to save the meta json file",
 )
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of worker processes, each reference is handled by one worker",
+)
+parser.add_argument(
+    "--shard-index",
+    type=int,
+    default=0,
+    help="Index of the reference shard processed by this run, in [0, num_shards)",
+)
+parser.add_argument(
+    "--num-shards",
+    type=int,
+    default=1,
+    help="Total number of reference shards, e.g. one per machine",
+)
+parser.add_argument(
+    "--merge-shards",
+    action="store_true",
+    help="Merge the per-shard meta files under json_path into meta.json and exit",
+)
+parser.add_argument(
+    "--plan",
+    type=str,
+    default=None,
+    help="Write the recipe plan (.npz) of the references of this shard, print its category balance and exit",
+)
+parser.add_argument(
+    "--from-plan",
+    type=str,
+    default=None,
+    help="Render the recipes of a plan written by --plan, references missing from it are skipped",
+)
+parser.add_argument(
+    "--decode-threads",
+    type=int,
+    default=2,
+    help="Threads decoding the next references ahead of the distortions (single worker only)",
+)
+parser.add_argument(
+    "--save-format",
+    type=str,
+    default=None,
+    choices=sorted(SAVE_FORMATS),
+    help="Format of the distorted images, defaults to the format of each reference",
+)
+parser.add_argument(
+    "--png-compress-level",
+    type=int,
+    default=None,
+    help="zlib level in [0, 9] for PNG outputs, lower is faster and larger",
+)
+parser.add_argument(
+    "--jpeg-quality",
+    type=int,
+    default=None,
+    help="Quality in [1, 95] for JPEG outputs",
+)
+parser.add_argument(
+    "--webp-lossless",
+    action="store_true",
+    help="Encode WebP outputs losslessly",
+)
+parser.add_argument(
+    "--tar-shards",
+    action="store_true",
+    help="Write size-bounded tar shards (reference, samples, per-sample json) instead of one file per sample",
+)
+parser.add_argument(
+    "--shard-max-mb",
+    type=int,
+    default=1024,
+    help="Size above which the next tar shard is started",
+)
+parser.add_argument(
+    "--precision",
+    type=str,
+    default="float64",
+    choices=sorted(precision.PRECISIONS),
+    help="Float dtype of the distortion functions, float32 halves their memory traffic, see x_distortion/precision.py",
+)
+parser.add_argument(
+    "--writer-threads",
+    type=int,
+    default=2,
+    help="Encoder threads per worker process, 0 encodes on the distortion thread",
+)
+parser.add_argument(
+    "--max-pending-writes",
+    type=int,
+    default=16,
+    help="Distorted images queued for encoding before the distortion thread waits",
+)
 
 
 
-def select_samples(num_samples, excluded_categories=None):
-    # if None, set an empty set
-    excluded_categories = excluded_categories or set()
+def init_writer(writer_kwargs, precision_name="float64"):
+    global WRITER
+    precision.set_precision(precision_name)
+    WRITER = ImageWriter(**writer_kwargs)
+    # pool workers skip atexit, Finalize still runs on pool.close() + pool.join()
+    Finalize(WRITER, WRITER.close, exitpriority=10)
 
-    category_pool = {}
-    for category, classes in CATEGORY_TO_CLASSES.items():
-        if category in excluded_categories:
-            continue
-        valid_classes = [cls for cls in classes if DIST_DICT.get(cls)]
-        if valid_classes:
-            category_pool[category] = valid_classes
 
-    if not category_pool:
-        for category, classes in CATEGORY_TO_CLASSES.items():
-            valid_classes = [cls for cls in classes if DIST_DICT.get(cls)]
-            if valid_classes:
-                category_pool[category] = valid_classes
+def is_generated(record, meta_store, tar_shards=False):
+    """True if the meta has an entry for the reference and every sample of it is written.
 
-    if not category_pool:
-        return []
+    The entry is only written once the files of the reference are, see
+    put_written; tar shard groups are written before their entry.
+    """
+    entry = meta_store.get(record.name)
+    if not entry:
+        return False
+    return tar_shards or all(os.path.exists(dis_info["img_lq"]) for dis_info in entry["distortions"])
 
-    categories = list(category_pool.keys())
-    weight_map = {cat: CATEGORY_WEIGHTS.get(cat, 1) for cat in categories}
 
-    if num_samples <= len(categories):
-        selected_categories = weighted_sample_without_replacement(categories, weight_map, num_samples)
-    else:
-        selected_categories = weighted_sample_without_replacement(categories, weight_map, len(categories))
-        remaining = num_samples - len(selected_categories)
-        if categories:
-            weights = [weight_map.get(cat, 1) for cat in categories]
-            if sum(weights) <= 0:
-                selected_categories.extend(random.choices(categories, k=remaining))
-            else:
-                selected_categories.extend(random.choices(categories, weights=weights, k=remaining))
-
-    sampled_funcs = []
-    for category in selected_categories:
-        classes = category_pool.get(category)
-        if not classes:
-            continue
-        distortion_class = random.choice(classes)
-        funcs = DIST_DICT.get(distortion_class)
-        if funcs:
-            sampled_funcs.append(random.choice(funcs))
+def process_reference(item, distortion_dir, num_samples, seed, num_severity=5, resize=768, tar_shards=False):
+    """Distort one reference image num_samples times.
+
+    item is (ImageRecord, decoded image or None, recipes or None); None decodes
+    the record here, or plans its recipes (recipe_plan.plan_recipes). Every
+    sample draws from a generator seeded by its recipe, so the result does not
+    depend on which worker or shard handles the reference.
+    The images are queued in the writer of the process and may still be encoded
+    when this returns, the caller puts the meta entry once they are on disk (see
+    put_written). With tar_shards the images are encoded here and returned as tar members,
+    the meta entry refers to member names until the group is written.
+    Returns (img_name, meta entry or None, [(member name, bytes), ...] or None).
+    """
+    record, img, recipes = item
+    img_path = record.path
+    img_name = record.name
+    img_ext = WRITER.output_ext(os.path.splitext(img_path)[1] or ".png")
+
+    if recipes is None:
+        recipes = group_plan(plan_recipes([img_name], seed, num_samples, num_severity))[img_name]
+    if img is None:
+        # decoded and resized once, read-only, shared by every sample
+        img = REF_CACHE.get(img_path, resize, data=record.data)
+
+    # collect meta info about distortion
+    dis_info_list = []
+    ref_name = f"{img_name}.ref{img_ext}"
+    members = [(ref_name, WRITER.encode(img, ref_name))] if tar_shards else None
+
+    for distortion_class, distortion_name, severity, sample_seed in recipes:
+        if tar_shards:
+            save_path = f"{img_name}_{len(dis_info_list)}{img_ext}"
+        else:
+            # never overwrite files of an earlier or concurrent run, which another meta may refer to
+            idx = 0
+            while True:
+                save_path = os.path.join(distortion_dir, f"{img_name}_{idx}{img_ext}")
+                if not WRITER.exists(save_path):
+                    break
+                idx += 1
+
+        img_lq = add_distortion(img, severity=severity, distortion_name=distortion_name, rng=sample_seed)
+        dis_info = {
+            "distortion_class": distortion_class,
+            "distortion_name": distortion_name,
+            "severity": severity,
+            "img_lq": save_path
+        }
+        if tar_shards:
+            sample_json = json.dumps(dict(dis_info, reference=ref_name, source_path=img_path))
+            members.append((save_path, WRITER.encode(img_lq, save_path)))
+            members.append((f"{os.path.splitext(save_path)[0]}.json", sample_json.encode("utf-8")))
+        else:
+            # encoded in the background while the next sample is distorted
+            WRITER.submit(img_lq, save_path)
+        dis_info_list.append(dis_info)
+
+    if not dis_info_list:
+        return img_name, None, None
+    entry = {
+        "image_path": ref_name if tar_shards else img_path,
+        "distortion_num": len(dis_info_list),
+        "distortions": dis_info_list,
+    }
+    if tar_shards:
+        entry["source_path"] = img_path
+    return img_name, entry, members
+
+
+def put_written(unwritten, meta_store, final=False):
+    """Put the meta entries of unwritten, in order, whose files are all on disk.
+
+    ImageWriter renames a file into place once it is completely written, so a
+    file on disk is written, also when a worker process wrote it. Encoding thus
+    overlaps with the next references and the meta never refers to a missing
+    file. With final (after the writers are closed) entries with a missing file
+    are dropped, a resumed run regenerates them.
+
+    @param unwritten (collections.deque): (img_name, meta entry) in input order
+    @return: number of entries put
+    """
+    count = 0
+    while unwritten:
+        img_name, entry = unwritten[0]
+        if all(os.path.exists(dis_info["img_lq"]) for dis_info in entry["distortions"]):
+            meta_store.put(img_name, entry)
+            count += 1
+        elif not final:
+            break
+        else:
+            print(f"Warning: not every distortion of {img_name} was written, it is left for a resumed run.")
+        unwritten.popleft()
+    return count
+
+
+def shard_json_path(json_dir, shard_index, num_shards):
+    if num_shards == 1:
+        return os.path.join(json_dir, "meta.json")
+    return os.path.join(json_dir, f"meta_shard{shard_index:05d}-of-{num_shards:05d}.json")
+
+
+def merge_shards(json_dir):
+    """Merge the per-shard meta files into meta.json, ordered by reference name."""
+    shard_paths = sorted(glob.glob(os.path.join(json_dir, "meta_shard*-of-*.jsonl")))
+    merged = {}
+    for shard_path in shard_paths:
+        merged.update(load_meta(shard_path))
+    merged = {img_name: merged[img_name] for img_name in sorted(merged)}
+    json_file_path = os.path.join(json_dir, "meta.json")
+    with open(json_file_path, "w") as fw:
+        json.dump(merged, fw, indent=4)
+    print(f"Merged {len(shard_paths)} shards with {len(merged)} entries into {json_file_path}")
 
-    return sampled_funcs
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    if args.merge_shards:
+        merge_shards(args.json_path)
+        sys.exit(0)
+    if not 0 <= args.shard_index < args.num_shards:
+        parser.error("--shard-index must be in [0, --num-shards)")
+
     num_severity = 5
     resize = 768
     seed_everything(seed=args.seed)
+    source = open_image_source(args.reference_dir, recursive=args.recursive)
+    if args.plan:
+        names = [record.name for record in source.shard(args.shard_index, args.num_shards)]
+        plan = plan_recipes(names, args.seed, args.num_samples, num_severity)
+        save_plan(args.plan, plan)
+        print(json.dumps(plan_summary(plan), indent=4))
+        sys.exit(0)
+    # reference name -> recipes of --from-plan, without it every reference is planned on the fly
+    recipes = group_plan(load_plan(args.from_plan)) if args.from_plan else {}
+
     distortion_dir = args.distortion_dir
     os.makedirs(distortion_dir, exist_ok=True)
     # info about saving json
-    json_file_path = os.path.join(args.json_path, "meta.json")
+    json_file_path = shard_json_path(args.json_path, args.shard_index, args.num_shards)
+    meta_store = open_meta_store(json_file_path)
     processed_count = 0
-    # collect image paths
-    reference_dir = args.reference_dir
-    img_types = ["*.png", "*.jpg", "*.jpeg","*.webp"]
-    img_paths = []
-    for img_type in img_types:
-        img_paths.extend(sorted(glob.glob(os.path.join(reference_dir, img_type))))
-    
-    for idx_ref, img_path in enumerate(img_paths):
-        print("=" * 100)
-        print(f"Processing image {idx_ref + 1}/{len(img_paths)}: {os.path.basename(img_path)}")
+    # streamed, the first references are processed while the rest is still being listed
+    records = (
+        record
+        for record in source.shard(args.shard_index, args.num_shards)
+        if not args.from_plan or record.name in recipes
+        if not is_generated(record, meta_store, args.tar_shards)
+    )
 
-        img_name = os.path.splitext(os.path.basename(img_path))[0]
-        img_ext = os.path.splitext(img_path)[1] or ".png"
-        img_lq_exist = os.path.exists(os.path.join(distortion_dir, f"{img_name}_0{img_ext}"))
-        if img_lq_exist:
-            print(f"{img_path} has been generated, skip.")
-            continue
+    worker = functools.partial(
+        process_reference,
+        distortion_dir=distortion_dir,
+        num_samples=args.num_samples,
+        seed=args.seed,
+        num_severity=num_severity,
+        resize=resize,
+        tar_shards=args.tar_shards,
+    )
+    writer_kwargs = dict(
+        num_threads=args.writer_threads,
+        max_pending=args.max_pending_writes,
+        save_format=args.save_format,
+        png_compress_level=args.png_compress_level,
+        jpeg_quality=args.jpeg_quality,
+        webp_lossless=args.webp_lossless,
+    )
+    if args.workers > 1:
+        pool = Pool(args.workers, initializer=init_writer, initargs=(writer_kwargs, args.precision))
+        # each worker decodes its own references
+        results = pool.imap(worker, ((record, None, recipes.get(record.name)) for record in records))
+    else:
+        pool = None
+        init_writer(writer_kwargs, args.precision)
+        decoded = iter_decoded(records, resize, num_threads=args.decode_threads)
+        results = map(worker, ((record, img, recipes.get(record.name)) for record, img in decoded))
 
-        # collect used distortion categories
-        used_categories = set()
-        # collect meta info about distortion
-        dis_info_list = []
-        
-        for img_idx in range(args.num_samples):
-            idx = 0
-            while True:
-                save_path = os.path.join(distortion_dir, f"{img_name}_{idx}{img_ext}")
-                if not os.path.exists(save_path):
-                    break
-                idx += 1
+    shard_writer = None
+    if args.tar_shards:
+        # one shard series per --shard-index, so concurrent shards never write the same tar
+        prefix = "shard" if args.num_shards == 1 else f"shard{args.shard_index:05d}-of-{args.num_shards:05d}"
+        shard_writer = ShardWriter(distortion_dir, prefix=prefix, max_bytes=args.shard_max_mb << 20)
 
-            distortion_func_names = select_samples(1, excluded_categories=used_categories)
-            if not distortion_func_names:
-                continue
-
-            distortion_name = distortion_func_names[0]
-            distortion_class = get_distortion_class(distortion_name)
-            category = get_category_from_class(distortion_class)
-            if category:
-                used_categories.add(category)
-            severity = random.randint(1, num_severity)
-
-            img = Image.open(img_path).convert("RGB")
-            h, w = img.height, img.width
-            if resize < min(h, w):
-                ratio = resize / min(h, w)
-                h_new, w_new = round(h * ratio), round(w * ratio)
-                img = img.resize((w_new, h_new), resample=Image.Resampling.BICUBIC)
-            img = np.array(img)
-            img_lq = add_distortion(img, severity=severity, distortion_name=distortion_name)
-            img_lq = Image.fromarray(img_lq)
-            img_lq.save(save_path)
-
-            dis_info_list.append({
-                "distortion_class": distortion_class,
-                "distortion_name": distortion_name,
-                "severity": severity,
-                "img_lq": save_path
-            })
-            
-
-        if dis_info_list:
-            entry = {
-                img_name: {
-                    "image_path": img_path,
-                    "distortion_num": len(dis_info_list),
-                    "distortions": dis_info_list,
-                }
-            }
-            save_json_append(json_file_path, entry)
+    # imap keeps the input order, so the meta is written identically for any worker count
+    unwritten = deque()
+    for idx_ref, (img_name, entry, members) in enumerate(results):
+        print("=" * 100)
+        print(f"Processed image {idx_ref + 1}: {img_name}")
+        if entry is None:
+            continue
+        if members:
+            # written before the meta entry, so a resumed run regenerates an unwritten group
+            paths = shard_writer.write_group(members)
+            entry["image_path"] = paths[entry["image_path"]]
+            for dis_info in entry["distortions"]:
+                dis_info["img_lq"] = paths[dis_info["img_lq"]]
+            meta_store.put(img_name, entry)
             processed_count += 1
+        else:
+            unwritten.append((img_name, entry))
+            processed_count += put_written(unwritten, meta_store)
+
+    if pool:
+        pool.close()
+        pool.join()
+    else:
+        WRITER.close()
+    processed_count += put_written(unwritten, meta_store, final=True)
+    if shard_writer:
+        shard_writer.close()
+    meta_store.close()
+    if args.num_shards == 1:
+        meta_store.export(json_file_path)
+    print(f"Finished shard {args.shard_index}/{args.num_shards}: {processed_count} references processed")
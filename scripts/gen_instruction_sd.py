@@ -2,10 +2,14 @@ import os
 import re
 import argparse
 import json
+import sys
 import torch
 from PIL import ImageFile
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 from transformers import Qwen3VLForConditionalGeneration, AutoProcessor
+sys.path.append("/home/dzc/yuanhao/syn_aes_data/utils")
+from meta_store import open_meta_store, load_meta
+from tar_shards import SHARD_SEP, open_image
 
 
 parser = argparse.ArgumentParser(description="Generate instructions for multiple distortions")
@@ -76,6 +80,12 @@ opposite_distortion_name_dict = {
         'oversharpen':'decrease_sharpness'
     }
 
+def image_content(img_path):
+    """Chat message image item, images inside tar shards are passed decoded."""
+    if SHARD_SEP in img_path:
+        return {"type": "image", "image": open_image(img_path).convert("RGB")}
+    return {"type": "image", "url": img_path}
+
 def generate_instruction(model, processor, img_ref_path, img_lq_path, distortion_name, severity):
     grades = ["slight distortion", "moderate distortion", "noticeable distortion", "severe distortion", "extreme distortion"]
     bea_grades = ["mild enhancement", "moderate enhancement", "notable enhancement", "significant enhancement", "dramatic enhancement"]
@@ -127,8 +137,8 @@ def generate_instruction(model, processor, img_ref_path, img_lq_path, distortion
     messages = [{
         "role": "user",
         "content": [
-            {"type": "image", "url": img_lq_path},
-            {"type": "image", "url": img_ref_path},
+            image_content(img_lq_path),
+            image_content(img_ref_path),
             {'type': "text" , "text": dist_info_text+query_text},
         ]
     }]  
@@ -177,18 +187,6 @@ def generate_instruction(model, processor, img_ref_path, img_lq_path, distortion
         }
 
 
-def load_existing_results(save_path):
-    if os.path.exists(save_path):
-        with open(save_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
-
-
-def save_results(save_path, results):
-    with open(save_path, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=4, ensure_ascii=False)
-
-
 if __name__ == "__main__":
     args = parser.parse_args()
     # load model
@@ -199,12 +197,11 @@ if __name__ == "__main__":
         device_map="cuda",
     )
 
-    with open(args.meta_json, 'r', encoding='utf-8') as f:
-        distortion_data = json.load(f)
+    distortion_data = load_meta(args.meta_json)
     
     os.makedirs(args.save_dir, exist_ok=True)
     main_results_path = os.path.join(args.save_dir, "instructions.json")
-    all_results = load_existing_results(main_results_path)
+    all_results = open_meta_store(main_results_path)
     
     total_entries=sum(
         len(image_data.get("distortions", []))
@@ -260,12 +257,14 @@ if __name__ == "__main__":
                     "instruction_4": instructions.get("instruction 4", ""),
             }
 
-            all_results[entry_key] = output_entry
-            save_results(main_results_path, all_results)
+            all_results.put(entry_key, output_entry)
             processed_count += 1
             print(f"Processed {processed_count + skipped_count}/{total_entries}: {entry_key}")
            
     
+    all_results.close()
+    all_results.export(main_results_path)
+
     print(f"=" * 80)
     print(f"Processing completed!")
     print(f"Total: {total_entries}")
@@ -0,0 +1,119 @@
+"""Content-addressed cache of distorted outputs.
+
+Reruns with other seeds or overlapping reference sets regenerate many identical
+(reference, recipe) pairs. ArtifactCache maps
+
+    sha256(reference file content, recipe)
+
+to the first artifact written for it, a file path or a tar shard member
+"<shard>::<member>", in the append-only {cache_dir}/index.jsonl. A hit is
+hard-linked to the new save path (copied across file systems), or its bytes are
+reused as tar member, so neither the distortion nor the encoding runs again.
+An artifact is put only once it is completely written, e.g. from the
+on_written callback of ImageWriter.submit, so a hit never links a missing or
+partial file.
+
+Recipes of stochastic distortions carry the seed of their own generator (see
+utils/tool.derive_seed), so equal recipes give equal outputs and a hit does
+not change what the following samples draw.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+from image_writer import partial_path
+from meta_store import MetaStore
+from tar_shards import SHARD_SEP, has_member, read_member
+
+
+def file_digest(path, data=None, chunk_size=1 << 20):
+    """sha256 hex digest of a file, or of data (bytes of an archive member) if given."""
+    if data is not None:
+        return hashlib.sha256(data).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, "rb") as fr:
+        for chunk in iter(lambda: fr.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir):
+        """
+        @param cache_dir (str): directory of the index, shared between runs
+        """
+        self.cache_dir = cache_dir
+        self.store = MetaStore(os.path.join(cache_dir, "index.jsonl"))
+        self.hits = 0
+        self.misses = 0
+        # put may run in writer threads
+        self._lock = threading.Lock()
+
+    def key(self, ref_digest, recipe):
+        """
+        @param ref_digest (str): file_digest of the reference
+        @param recipe (dict): everything else the output depends on, json-serializable,
+            including the seed of stochastic distortions
+        """
+        payload = {"reference": ref_digest, "recipe": recipe}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _available(path):
+        if SHARD_SEP in path:
+            return has_member(path)
+        return os.path.exists(path)
+
+    def get(self, key):
+        """Entry {"path"} of key, None if unknown or its artifact was deleted."""
+        with self._lock:
+            entry = self.store.get(key)
+        if entry is None or not self._available(entry["path"]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, path):
+        """
+        @param path (str): completely written artifact, file path or "<shard>::<member>",
+            safe to call from writer threads
+        """
+        path = str(path)
+        with self._lock:
+            self.store.put(key, {"path": os.path.abspath(path) if SHARD_SEP not in path else path})
+
+    def link(self, entry, save_path):
+        """Hard-link (or copy) the file of entry to save_path.
+
+        Nothing to do if save_path already is that file. Otherwise the link is
+        made on a partial path and renamed into place, so an existing save_path
+        is replaced, never written through.
+        """
+        src = entry["path"]
+        if os.path.exists(save_path) and os.path.samefile(src, save_path):
+            return
+        tmp_path = partial_path(save_path)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, save_path)
+
+    def read(self, entry):
+        """Encoded bytes of the artifact of entry, e.g. to add it to a tar shard."""
+        if SHARD_SEP in entry["path"]:
+            return read_member(entry["path"])
+        with open(entry["path"], "rb") as fr:
+            return fr.read()
+
+    def close(self):
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
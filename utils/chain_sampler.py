@@ -0,0 +1,145 @@
+"""Rejection-free sampler of multi-distortion class chains.
+
+add_distortion_md.py used to draw a chain class by class (first class uniform
+over the allowed categories, every next class uniform over the classes
+compatible with the last one, see constants_md.multi_distortions_dict) and to
+redraw, up to 50 times, chains whose class set was already used for the
+reference. ChainSampler enumerates every chain with its probability under that
+process once. sample then draws directly from the same process conditioned on
+the chain being unused: a hash set of canonical chains (sorted class tuples)
+marks the used ones, their probability mass is skipped, and sampling always
+terminates, returning None only when every allowed chain is used.
+"""
+import random
+from bisect import bisect_right
+from collections import Counter, defaultdict
+
+# probability mass below which a first class counts as exhausted
+_EPS = 1e-12
+
+
+def canonical_chain(classes):
+    """Hashable key of a chain, chains with the same classes in another order are equal."""
+    classes = classes if isinstance(classes, (list, tuple)) else [classes]
+    return tuple(sorted(classes))
+
+
+class ChainSampler:
+    def __init__(self, category_to_classes, compatible_classes, num_distortions=2, known_classes=None):
+        """
+        @param category_to_classes (dict): category -> distortion classes
+        @param compatible_classes (dict): class -> classes that may follow it
+        @param num_distortions (int): classes per chain, > 1
+        @param known_classes (iterable): classes that have distortions, compatible
+            classes outside of it are never drawn; None allows all
+        """
+        if num_distortions <= 1:
+            raise ValueError("Only support num_distortions > 1.")
+        self.category_to_classes = category_to_classes
+        self.num_distortions = num_distortions
+        self.classes = list(dict.fromkeys(c for classes in category_to_classes.values() for c in classes))
+        allowed = set(self.classes)
+        if known_classes is not None:
+            known_classes = set(known_classes)
+        self.compatible = {
+            cls: [c for c in nexts if c in allowed and (known_classes is None or c in known_classes)]
+            for cls, nexts in compatible_classes.items()
+        }
+        # first class -> chains starting with it, and the cumulative probability of
+        # every chain given the first class
+        self._chains = {}
+        self._cum = {}
+        # canonical chain -> [(first class, chain index), ...]
+        self._key_index = defaultdict(list)
+        for first in self.classes:
+            chains, cum, total = [], [], 0.0
+            for chain, prob in self._enumerate([first], 1.0):
+                total += prob
+                chains.append(chain)
+                cum.append(total)
+                self._key_index[canonical_chain(chain)].append((first, len(chains) - 1))
+            self._chains[first] = chains
+            self._cum[first] = cum
+
+    def _next_options(self, selected):
+        """Counter of the classes that may follow selected, each option equally likely."""
+        compatible = [c for c in self.compatible.get(selected[-1], []) if c not in selected]
+        if compatible:
+            return Counter(compatible)
+        remaining = [c for c in self.classes if c not in selected]
+        return Counter(remaining or self.classes)
+
+    def _enumerate(self, selected, prob):
+        if len(selected) == self.num_distortions:
+            yield tuple(selected), prob
+            return
+        options = self._next_options(selected)
+        num_options = sum(options.values())
+        for cls, count in options.items():
+            yield from self._enumerate(selected + [cls], prob * count / num_options)
+
+    def _first_candidates(self, excluded_categories):
+        if excluded_categories:
+            candidates = [
+                cls
+                for category, classes in self.category_to_classes.items()
+                if category not in excluded_categories
+                for cls in classes
+                if cls in self._chains
+            ]
+            if candidates:
+                return candidates
+        return self.classes
+
+    def _prob(self, first, idx):
+        cum = self._cum[first]
+        return cum[idx] - (cum[idx - 1] if idx else 0.0)
+
+    def sample(self, excluded_categories=None, used=(), rng=None):
+        """Draw a chain whose canonical_chain is not in used.
+
+        @param excluded_categories (set): categories the first class is not drawn
+            from, ignored if they exclude every class
+        @param used (set): canonical_chain of the chains to avoid
+        @param rng (random.Random): defaults to the random module
+        @return: list of classes, None if every allowed chain is used
+        """
+        rng = rng or random
+        candidates = self._first_candidates(excluded_categories)
+        # chain indices to skip per first class, only the few used chains are visited
+        skipped = defaultdict(set)
+        for key in used:
+            for first, idx in self._key_index.get(key, ()):
+                skipped[first].add(idx)
+        # the first classes are equally likely, weighted by their unused chain mass
+        weights = []
+        for first in candidates:
+            weight = self._cum[first][-1] - sum(self._prob(first, idx) for idx in skipped[first])
+            weights.append(weight if weight > _EPS else 0.0)
+        total = sum(weights)
+        if total <= 0.0:
+            return None
+
+        r = rng.random() * total
+        for cls, weight in zip(candidates, weights):
+            if weight > 0.0:
+                # the last class with mass also takes the rounding remainder
+                first = cls
+                if r < weight:
+                    break
+                r -= weight
+
+        # map r from the unused mass onto the full cumulative range by stepping over used chains
+        cum = self._cum[first]
+        r = rng.random() * (cum[-1] - sum(self._prob(first, idx) for idx in skipped[first]))
+        for idx in sorted(skipped[first]):
+            if r >= (cum[idx - 1] if idx else 0.0):
+                r += self._prob(first, idx)
+            else:
+                break
+        idx = min(bisect_right(cum, r), len(cum) - 1)
+        # rounding may land on a used chain, take the nearest unused one
+        if idx in skipped[first]:
+            unused = [i for i in range(len(cum)) if i not in skipped[first]]
+            idx = min(unused, key=lambda i: abs(i - idx))
+        return list(self._chains[first][idx])
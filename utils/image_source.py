@@ -0,0 +1,191 @@
+"""Streaming reference image sources for the distortion scripts.
+
+An ImageSource yields ImageRecord(path, name, data) lazily, so generation
+starts on the first image instead of after a glob + sort of the whole corpus:
+
+    path: str, file path, or "<archive>::<member>" for tar/zip members
+    name: str, output file stem, the path relative to the source root without
+        extension and with "/" replaced by "_" (the file stem for flat dirs)
+    data: bytes of archive members, None for files on disk
+
+open_image_source picks the source from the spec:
+
+    <dir>                   DirectorySource, optionally recursive
+    <list>.txt / .lst       FileListSource, one image path per line
+    <shard>.tar, "*.tar"    TarSource, tar or WebDataset shards (glob allowed)
+    <archive>.zip           ZipSource
+
+iter_decoded decodes and resizes the records in a few threads ahead of the
+consumer; PIL releases the GIL while decoding.
+"""
+import io
+import os
+import glob
+import zlib
+import posixpath
+import tarfile
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from ref_cache import load_reference
+
+IMG_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+
+ImageRecord = namedtuple("ImageRecord", ["path", "name", "data"])
+
+
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMG_EXTS
+
+
+def record_name(rel_path):
+    # archive members may be "./a/b.png" (tar -C dir .) or "/a/b.png"
+    rel_path = posixpath.normpath(rel_path.replace("\\", "/")).lstrip("/")
+    return posixpath.splitext(rel_path)[0].replace("/", "_")
+
+
+def shard_of(name, num_shards):
+    """Stable shard index of a record, independent of listing order and machine."""
+    return zlib.crc32(name.encode("utf-8")) % num_shards
+
+
+class ImageSource:
+    def __iter__(self):
+        raise NotImplementedError
+
+    def shard(self, shard_index, num_shards):
+        """Yield the records of shard shard_index out of num_shards."""
+        if num_shards == 1:
+            yield from self
+            return
+        for record in self:
+            if shard_of(record.name, num_shards) == shard_index:
+                yield record
+
+
+class DirectorySource(ImageSource):
+    def __init__(self, root, recursive=False):
+        self.root = root
+        self.recursive = recursive
+
+    def _walk(self, dir_path):
+        # sorted per directory, so the order is deterministic without listing the whole tree first
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            if entry.is_dir():
+                if self.recursive:
+                    yield from self._walk(entry.path)
+            elif is_image(entry.name):
+                yield entry.path
+
+    def __iter__(self):
+        for path in self._walk(self.root):
+            yield ImageRecord(path, record_name(os.path.relpath(path, self.root)), None)
+
+
+class FileListSource(ImageSource):
+    def __init__(self, list_path):
+        """
+        @param list_path (str): text file with one image path per line, relative
+            paths are resolved against the directory of the list
+        """
+        self.list_path = list_path
+
+    def __iter__(self):
+        list_dir = os.path.dirname(self.list_path)
+        with open(self.list_path, "r", encoding="utf-8") as fr:
+            for line in fr:
+                path = line.strip()
+                if not path:
+                    continue
+                path = os.path.join(list_dir, path)
+                yield ImageRecord(path, record_name(os.path.basename(path)), None)
+
+
+class TarSource(ImageSource):
+    def __init__(self, tar_paths):
+        """
+        @param tar_paths (list): tar or WebDataset shards, read in this order;
+            non-image members (e.g. WebDataset .json/.txt) are skipped
+        """
+        self.tar_paths = list(tar_paths)
+
+    def _iter_tars(self, tar_paths):
+        for tar_path in tar_paths:
+            # stream mode, the shard is read once front to back
+            with tarfile.open(tar_path, "r|*") as tf:
+                for member in tf:
+                    if not member.isfile() or not is_image(member.name):
+                        continue
+                    data = tf.extractfile(member).read()
+                    yield ImageRecord(f"{tar_path}::{member.name}", record_name(member.name), data)
+
+    def __iter__(self):
+        return self._iter_tars(self.tar_paths)
+
+    def shard(self, shard_index, num_shards):
+        if len(self.tar_paths) >= num_shards:
+            # whole tars per shard, so a shard never reads the others' tars
+            return self._iter_tars(self.tar_paths[shard_index::num_shards])
+        return super().shard(shard_index, num_shards)
+
+
+class ZipSource(ImageSource):
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+
+    def __iter__(self):
+        with zipfile.ZipFile(self.zip_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not is_image(info.filename):
+                    continue
+                data = zf.read(info)
+                yield ImageRecord(f"{self.zip_path}::{info.filename}", record_name(info.filename), data)
+
+
+def open_image_source(spec, recursive=False):
+    """Build the ImageSource for a directory, file list, tar shard(s) or zip archive."""
+    if os.path.isdir(spec):
+        return DirectorySource(spec, recursive=recursive)
+    ext = os.path.splitext(spec)[1].lower()
+    if ext in (".txt", ".lst"):
+        return FileListSource(spec)
+    if ext == ".zip":
+        return ZipSource(spec)
+    if ext == ".tar":
+        tar_paths = sorted(glob.glob(spec)) if glob.has_magic(spec) else [spec]
+        if not tar_paths:
+            raise ValueError(f"No tar shards match {spec}")
+        return TarSource(tar_paths)
+    raise ValueError(f"Unknown image source: {spec}")
+
+
+def decode_record(record, resize):
+    """Decoded and resized image of a record (np.ndarray, uint8, read-only)."""
+    src = record.path if record.data is None else io.BytesIO(record.data)
+    img = load_reference(src, resize)
+    img.flags.writeable = False
+    return img
+
+
+def iter_decoded(records, resize, num_threads=2, max_pending=8):
+    """Yield (record, decoded image) in order, decoding up to max_pending records ahead.
+
+    @param num_threads (int): decode threads, 0 decodes in the consumer thread
+    """
+    if num_threads <= 0:
+        for record in records:
+            yield record, decode_record(record, resize)
+        return
+    with ThreadPoolExecutor(num_threads) as executor:
+        pending = deque()
+        for record in records:
+            pending.append((record, executor.submit(decode_record, record, resize)))
+            if len(pending) >= max_pending:
+                record, future = pending.popleft()
+                yield record, future.result()
+        while pending:
+            record, future = pending.popleft()
+            yield record, future.result()
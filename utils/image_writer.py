@@ -0,0 +1,172 @@
+"""Asynchronous image writer for the distortion scripts.
+
+PIL releases the GIL while encoding, so a few threads can encode the distorted
+images of one reference while the caller is already distorting the next one.
+submit blocks once max_pending images are queued (backpressure), so memory
+stays bounded when the encoder is slower than the distortions.
+
+Files are encoded to a partial path and renamed into place, so a reader never
+sees a partial file and an existing save path that is a hard link (see
+artifact_cache.py) is replaced instead of being truncated for every link.
+"""
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# save_format -> file extension
+SAVE_FORMATS = {
+    "png": ".png",
+    "jpeg": ".jpg",
+    "webp": ".webp",
+}
+
+
+def get_output_ext(img_ext, save_format=None):
+    """Extension of the distorted images of a reference with extension img_ext."""
+    if save_format is None:
+        return img_ext
+    return SAVE_FORMATS[save_format]
+
+
+def partial_path(save_path):
+    """Temporary path next to save_path, unique per process and thread, to os.replace into place."""
+    return f"{save_path}.{os.getpid()}-{threading.get_ident()}.part"
+
+
+class ImageWriter:
+    def __init__(
+        self,
+        num_threads=2,
+        max_pending=16,
+        save_format=None,
+        png_compress_level=None,
+        jpeg_quality=None,
+        webp_lossless=False,
+    ):
+        """
+        @param num_threads (int): encoder threads, 0 encodes synchronously in submit
+        @param max_pending (int): queued images above which submit blocks
+        @param save_format (str): one of SAVE_FORMATS, None keeps the extension of the save path
+        @param png_compress_level (int): zlib level in [0, 9], None for the PIL default
+        @param jpeg_quality (int): JPEG quality in [1, 95], None for the PIL default
+        @param webp_lossless (bool): encode WebP losslessly
+        """
+        if save_format is not None and save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unknown save_format: {save_format}")
+        self.save_format = save_format
+        self.png_compress_level = png_compress_level
+        self.jpeg_quality = jpeg_quality
+        self.webp_lossless = webp_lossless
+        self._executor = ThreadPoolExecutor(num_threads) if num_threads > 0 else None
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._errors = []
+
+    def output_ext(self, img_ext):
+        """Extension of the written files for a reference with extension img_ext."""
+        return get_output_ext(img_ext, self.save_format)
+
+    def save_kwargs(self, save_path):
+        ext = os.path.splitext(save_path)[1].lower()
+        if ext == ".png" and self.png_compress_level is not None:
+            return {"compress_level": self.png_compress_level}
+        if ext in (".jpg", ".jpeg") and self.jpeg_quality is not None:
+            return {"quality": self.jpeg_quality}
+        if ext == ".webp" and self.webp_lossless:
+            return {"lossless": True}
+        return {}
+
+    def encode(self, img, name):
+        """Encode img (np.ndarray, uint8) in the format of the extension of name, e.g. for tar shards."""
+        ext = os.path.splitext(name)[1].lower()
+        buf = io.BytesIO()
+        Image.fromarray(img).save(buf, format=Image.registered_extensions()[ext], **self.save_kwargs(name))
+        return buf.getvalue()
+
+    def is_pending(self, save_path):
+        """True if save_path is queued or being written."""
+        with self._lock:
+            return os.path.abspath(save_path) in self._pending
+
+    def exists(self, save_path):
+        """True if save_path is on disk or queued for writing."""
+        return self.is_pending(save_path) or os.path.exists(save_path)
+
+    def _save(self, img, save_path, on_written=None):
+        ext = os.path.splitext(save_path)[1].lower()
+        tmp_path = partial_path(save_path)
+        try:
+            Image.fromarray(img).save(
+                tmp_path, format=Image.registered_extensions()[ext], **self.save_kwargs(save_path)
+            )
+            os.replace(tmp_path, save_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if on_written is not None:
+            on_written(save_path)
+
+    def _done(self, save_path, future):
+        with self._lock:
+            self._pending.pop(save_path, None)
+            if future.exception() is not None:
+                self._errors.append((save_path, future.exception()))
+        self._slots.release()
+
+    def _raise_errors(self):
+        with self._lock:
+            if not self._errors:
+                return
+            save_path, error = self._errors[0]
+            self._errors.clear()
+        raise IOError(f"Failed to write {save_path}") from error
+
+    def submit(self, img, save_path, on_written=None):
+        """Queue img (np.ndarray, uint8, H x W x 3) for writing; img must not be modified afterwards.
+
+        @param on_written (callable): called with save_path once the file is written,
+            from an encoder thread
+        """
+        self._raise_errors()
+        save_path = str(save_path)
+        if self._executor is None:
+            self._save(img, save_path, on_written)
+            return
+        # keyed by absolute path, so relative and absolute spellings of a path match
+        key = os.path.abspath(save_path)
+        self._slots.acquire()
+        with self._lock:
+            future = self._executor.submit(self._save, img, save_path, on_written)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+
+    def flush(self):
+        """Wait until every queued image is written."""
+        with self._lock:
+            pending = list(self._pending.items())
+        for save_path, future in pending:
+            # the done callback may not have recorded the error yet
+            if future.exception() is not None:
+                with self._lock:
+                    self._errors.clear()
+                raise IOError(f"Failed to write {save_path}") from future.exception()
+        self._raise_errors()
+
+    def close(self):
+        if self._executor is not None:
+            try:
+                self.flush()
+            finally:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,149 @@
+"""Append-only JSONL store for the dict-shaped meta/instruction json files.
+
+Every record is one line ``{"key": ..., "value": ...}``; a later record with
+the same key replaces the earlier one. Appending a reference costs O(1) I/O
+instead of re-reading and rewriting the whole json, and ``export`` compacts
+the log back into the ``{key: value}`` json the downstream scripts expect.
+
+    python utils/meta_store.py export --src meta.jsonl --dst meta.json
+"""
+import os
+import json
+import argparse
+
+
+class MetaStore:
+    def __init__(self, path, fsync_every=64):
+        """
+        @param path (str): path of the .jsonl log, created if missing
+        @param fsync_every (int): records buffered between two fsync calls
+        """
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self._offsets = {}
+        self._pending = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._recover()
+        self._fw = open(path, "ab")
+
+    def _recover(self):
+        """Build the key -> offset index, dropping a torn tail left by a crash."""
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0
+        with open(self.path, "rb") as fr:
+            for line in fr:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self._offsets[record["key"]] = valid_end
+                valid_end += len(line)
+        if valid_end != os.path.getsize(self.path):
+            print(f"Warning: truncating incomplete record at byte {valid_end} of {self.path}")
+            with open(self.path, "r+b") as fw:
+                fw.truncate(valid_end)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __contains__(self, key):
+        return key in self._offsets
+
+    def keys(self):
+        return self._offsets.keys()
+
+    def get(self, key, default=None):
+        if key not in self._offsets:
+            return default
+        self._flush()
+        with open(self.path, "rb") as fr:
+            fr.seek(self._offsets[key])
+            return json.loads(fr.readline())["value"]
+
+    def put(self, key, value):
+        line = json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n"
+        self._offsets[key] = self._fw.tell()
+        self._fw.write(line.encode("utf-8"))
+        self._pending += 1
+        if self._pending >= self.fsync_every:
+            self.sync()
+
+    def update(self, new_data):
+        for key, value in new_data.items():
+            self.put(key, value)
+
+    def _flush(self):
+        if not self._fw.closed:
+            self._fw.flush()
+
+    def sync(self):
+        self._fw.flush()
+        os.fsync(self._fw.fileno())
+        self._pending = 0
+
+    def items(self):
+        """Yield the latest (key, value) of every key, in first-insertion order."""
+        self._flush()
+        with open(self.path, "rb") as fr:
+            for key, offset in self._offsets.items():
+                fr.seek(offset)
+                yield key, json.loads(fr.readline())["value"]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def export(self, json_file_path):
+        """Write the compacted dict-shaped json atomically."""
+        os.makedirs(os.path.dirname(json_file_path) or ".", exist_ok=True)
+        tmp_path = json_file_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fw:
+            json.dump(self.to_dict(), fw, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, json_file_path)
+
+    def import_json(self, json_file_path):
+        """Seed an empty store from a legacy dict-shaped json."""
+        with open(json_file_path, "r", encoding="utf-8") as fr:
+            self.update(json.load(fr))
+        self.sync()
+
+    def close(self):
+        if not self._fw.closed:
+            self.sync()
+            self._fw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_meta_store(json_file_path, fsync_every=64):
+    """Open the .jsonl store that backs json_file_path, migrating an old json once."""
+    store = MetaStore(os.path.splitext(json_file_path)[0] + ".jsonl", fsync_every=fsync_every)
+    if len(store) == 0 and os.path.exists(json_file_path):
+        store.import_json(json_file_path)
+    return store
+
+
+def load_meta(meta_path):
+    """Load a meta file as a dict, either a compacted .json or a .jsonl log."""
+    if meta_path.endswith(".jsonl"):
+        with MetaStore(meta_path) as store:
+            return store.to_dict()
+    with open(meta_path, "r", encoding="utf-8") as fr:
+        return json.load(fr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact a JSONL meta store")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--src", type=str, required=True, help="Path of the .jsonl store")
+    parser.add_argument("--dst", type=str, required=True, help="Path of the exported .json")
+    args = parser.parse_args()
+    with MetaStore(args.src) as store:
+        store.export(args.dst)
+        print(f"Exported {len(store)} entries to {args.dst}")
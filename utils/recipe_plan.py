@@ -0,0 +1,110 @@
+"""Dataset-wide recipe planning for add_distortion_sd.py.
+
+The recipe of every sample (distortion class and function, severity and the
+seed of its random stream) only depends on (seed, reference name, sample
+index), so the whole plan can be drawn before any pixel work, checked for
+category balance, and then executed row by row by any worker:
+
+    python scripts/add_distortion_sd.py ... --plan plan.npz         # plan only
+    python scripts/add_distortion_sd.py ... --from-plan plan.npz    # render it
+
+A plan is a columnar .npz with one row per sample, grouped by reference:
+
+    reference (str), idx (int32), distortion_class (str), distortion_name (str),
+    severity (int8), sample_seed (uint32)
+
+Per reference one generator draws the categories (CATEGORY_SAMPLER, distinct
+categories while there are enough) and a block of uniforms; the classes,
+functions and severities are then looked up for the whole table at once.
+"""
+from collections import Counter
+
+import numpy as np
+
+from constant import DIST_DICT
+from tool import CATEGORY_POOL, CATEGORY_SAMPLER, derive_seed
+
+PLAN_COLUMNS = ("reference", "idx", "distortion_class", "distortion_name", "severity", "sample_seed")
+
+# category -> class -> function tables, flattened so a whole plan is looked up with numpy indexing
+_CLASSES = [cls for category in CATEGORY_SAMPLER.categories for cls in CATEGORY_POOL[category]]
+_CLASS_COUNT = np.array([len(CATEGORY_POOL[category]) for category in CATEGORY_SAMPLER.categories])
+_CLASS_OFFSET = np.concatenate([[0], np.cumsum(_CLASS_COUNT)[:-1]])
+_NAMES = [name for cls in _CLASSES for name in DIST_DICT[cls]]
+_NAME_COUNT = np.array([len(DIST_DICT[cls]) for cls in _CLASSES])
+_NAME_OFFSET = np.concatenate([[0], np.cumsum(_NAME_COUNT)[:-1]])
+
+
+def plan_recipes(names, seed, num_samples, num_severity=5):
+    """Recipe table of num_samples samples for every reference name.
+
+    @param names (list): reference names (ImageRecord.name)
+    @return: dict of PLAN_COLUMNS -> np.ndarray, num_samples rows per reference
+    """
+    num_refs = len(names)
+    categories = np.empty((num_refs, num_samples), dtype=np.int64)
+    uniforms = np.empty((num_refs, 3, num_samples), dtype=np.float64)
+    sample_seeds = np.empty((num_refs, num_samples), dtype=np.uint32)
+    for i, name in enumerate(names):
+        rng = np.random.default_rng(derive_seed(seed, name))
+        selected = CATEGORY_SAMPLER.sample(rng, num_samples)
+        if len(selected) < num_samples:
+            selected += CATEGORY_SAMPLER.sample(rng, num_samples - len(selected), replace=True)
+        categories[i] = [CATEGORY_SAMPLER.index[category] for category in selected]
+        uniforms[i] = rng.random((3, num_samples))
+        sample_seeds[i] = rng.integers(2**32, size=num_samples, dtype=np.uint32)
+
+    class_ids = _CLASS_OFFSET[categories] + (uniforms[:, 0] * _CLASS_COUNT[categories]).astype(np.int64)
+    name_ids = _NAME_OFFSET[class_ids] + (uniforms[:, 1] * _NAME_COUNT[class_ids]).astype(np.int64)
+    severities = 1 + (uniforms[:, 2] * num_severity).astype(np.int8)
+    return {
+        "reference": np.repeat(np.asarray(names, dtype=str), num_samples),
+        "idx": np.tile(np.arange(num_samples, dtype=np.int32), num_refs),
+        "distortion_class": np.asarray(_CLASSES, dtype=str)[class_ids.ravel()],
+        "distortion_name": np.asarray(_NAMES, dtype=str)[name_ids.ravel()],
+        "severity": severities.ravel(),
+        "sample_seed": sample_seeds.ravel(),
+    }
+
+
+def save_plan(plan_path, plan):
+    np.savez_compressed(plan_path, **plan)
+
+
+def load_plan(plan_path):
+    with np.load(plan_path) as data:
+        missing = set(PLAN_COLUMNS) - set(data.files)
+        if missing:
+            raise ValueError(f"{plan_path} is not a recipe plan, missing columns: {sorted(missing)}")
+        return {column: data[column] for column in PLAN_COLUMNS}
+
+
+def group_plan(plan):
+    """{reference: [(distortion_class, distortion_name, severity, sample_seed), ...]} in plan order."""
+    rows = zip(
+        plan["reference"].tolist(),
+        plan["distortion_class"].tolist(),
+        plan["distortion_name"].tolist(),
+        plan["severity"].tolist(),
+        plan["sample_seed"].tolist(),
+    )
+    groups = {}
+    for reference, *recipe in rows:
+        groups.setdefault(reference, []).append(tuple(recipe))
+    return groups
+
+
+def plan_summary(plan):
+    """Sample counts per category, class and severity, to check the balance of a plan."""
+    class_to_category = {cls: category for category, classes in CATEGORY_POOL.items() for cls in classes}
+    classes = Counter(plan["distortion_class"].tolist())
+    categories = Counter()
+    for cls, count in classes.items():
+        categories[class_to_category[cls]] += count
+    return {
+        "references": len(np.unique(plan["reference"])),
+        "samples": len(plan["reference"]),
+        "category": dict(categories.most_common()),
+        "class": dict(classes.most_common()),
+        "severity": dict(sorted(Counter(plan["severity"].tolist()).items())),
+    }
@@ -0,0 +1,65 @@
+"""Decode-once cache of resized reference images.
+
+The generation scripts distort every reference several times (and retry up to
+50 times in add_distortion_md.py). ReferenceCache decodes and resizes each
+reference once and hands out read-only arrays, so a distortion cannot modify
+the cached pixels. add_distortion copies the input only for the distortions
+that write into it (registry flag mutates_input), every other distortion reads
+the cached array directly.
+"""
+import io
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def load_reference(img_path, resize):
+    """Decode img_path (path or file object) as RGB and BICUBIC-resize its short side down to resize."""
+    img = Image.open(img_path).convert("RGB")
+    h, w = img.height, img.width
+    if resize < min(h, w):
+        ratio = resize / min(h, w)
+        h_new, w_new = round(h * ratio), round(w * ratio)
+        img = img.resize((w_new, h_new), resample=Image.Resampling.BICUBIC)
+    return np.array(img)
+
+
+class ReferenceCache:
+    def __init__(self, max_bytes=1 << 30):
+        """
+        @param max_bytes (int): total size of the cached arrays, least recently
+            used references are evicted above it
+        """
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._arrays = OrderedDict()
+
+    def __len__(self):
+        return len(self._arrays)
+
+    def __contains__(self, key):
+        return key in self._arrays
+
+    def get(self, img_path, resize=768, data=None):
+        """Return the decoded and resized reference as a read-only uint8 array.
+
+        @param data (bytes): encoded image of an archive member, decoded instead of img_path
+        """
+        key = (str(img_path), resize)
+        if key in self._arrays:
+            self._arrays.move_to_end(key)
+            return self._arrays[key]
+        img = load_reference(img_path if data is None else io.BytesIO(data), resize)
+        img.flags.writeable = False
+        self._arrays[key] = img
+        self.nbytes += img.nbytes
+        # always keep the newest entry, even if it alone exceeds max_bytes
+        while self.nbytes > self.max_bytes and len(self._arrays) > 1:
+            _, evicted = self._arrays.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        return img
+
+    def clear(self):
+        self._arrays.clear()
+        self.nbytes = 0
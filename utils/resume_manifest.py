@@ -0,0 +1,76 @@
+"""Append-only manifest of the output files a generation run has finished.
+
+add_distortion_md.py used to stat every output of every reference to decide
+whether to skip it, and probed os.path.exists for the next free output index.
+On network storage a resume of a large run spent hours on those calls.
+ResumeManifest keeps the names of the written files in memory, backed by one
+line per file in a log that ImageWriter appends to right after a file is
+written, so a resume needs no filesystem probes. A torn last line left by a
+crash is dropped, its file is simply written again.
+"""
+import os
+import threading
+
+
+class ResumeManifest:
+    def __init__(self, path, fsync_every=256):
+        """
+        @param path (str): path of the manifest log, created if missing
+        @param fsync_every (int): lines written between two fsync calls
+        """
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self._names = set()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.created = not os.path.exists(path)
+        if not self.created:
+            self._recover()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fw = open(path, "ab")
+
+    def _recover(self):
+        valid_end = 0
+        with open(self.path, "rb") as fr:
+            for line in fr:
+                if not line.endswith(b"\n"):
+                    break
+                self._names.add(line[:-1].decode("utf-8"))
+                valid_end += len(line)
+        if valid_end != os.path.getsize(self.path):
+            with open(self.path, "r+b") as fw:
+                fw.truncate(valid_end)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, file_name):
+        return file_name in self._names
+
+    def add(self, save_path):
+        """Record the written file save_path (by file name), safe to call from writer threads."""
+        file_name = os.path.basename(str(save_path))
+        with self._lock:
+            if file_name in self._names:
+                return
+            self._names.add(file_name)
+            self._fw.write(file_name.encode("utf-8") + b"\n")
+            # flushed per line, so a crash of the process loses nothing that is on disk
+            self._fw.flush()
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                os.fsync(self._fw.fileno())
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if not self._fw.closed:
+                self._fw.flush()
+                os.fsync(self._fw.fileno())
+                self._fw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,143 @@
+"""Size-bounded tar shards for the distorted datasets.
+
+Instead of one file per distorted sample, ShardWriter appends each reference
+as one group of tar members to {prefix}-{index:06d}.tar:
+
+    {img_name}.ref{ext}     the resized reference the distortions were made from
+    {img_name}_{idx}{ext}   the distorted samples
+    {img_name}_{idx}.json   per-sample metadata
+
+Member names follow the WebDataset convention (key = name up to the first
+dot), so the shards can be streamed as WebDataset shards. Next to every shard,
+{shard}.idx.jsonl lists {"name", "offset", "size"} of its members for random
+access. It is appended after the group is flushed to the tar, so a crash never
+indexes bytes that were not written. Images inside shards are addressed as
+"<shard path>::<member name>" in the meta files, see open_image.
+"""
+import io
+import os
+import re
+import json
+import tarfile
+from functools import lru_cache
+
+from PIL import Image
+
+SHARD_SEP = "::"
+
+
+class ShardWriter:
+    def __init__(self, out_dir, prefix="shard", max_bytes=1 << 30):
+        """
+        @param out_dir (str): directory of the shards
+        @param prefix (str): shard file prefix, e.g. per run or per --shard-index
+        @param max_bytes (int): a new shard is started once a group would exceed it
+        """
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        os.makedirs(out_dir, exist_ok=True)
+        # never append to shards of an earlier (possibly crashed) run
+        pattern = re.compile(rf"{re.escape(prefix)}-(\d{{6}})\.tar$")
+        indices = [int(m.group(1)) for m in map(pattern.match, os.listdir(out_dir)) if m]
+        self.index = max(indices) + 1 if indices else 0
+        self._tar = None
+        self._idx = None
+
+    @property
+    def shard_path(self):
+        return os.path.join(self.out_dir, f"{self.prefix}-{self.index:06d}.tar")
+
+    def _open(self):
+        self._tar = tarfile.open(self.shard_path, "w")
+        self._idx = open(self.shard_path + ".idx.jsonl", "a", encoding="utf-8")
+
+    def _close_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._idx.close()
+            self._tar = self._idx = None
+            self.index += 1
+
+    def write_group(self, members):
+        """Write [(member name, bytes), ...] into one shard.
+
+        @return: {member name: "<shard path>::<member name>"}
+        """
+        group_bytes = sum(tarfile.BLOCKSIZE + len(data) for _, data in members)
+        if self._tar is not None and self._tar.offset + group_bytes > self.max_bytes:
+            self._close_shard()
+        if self._tar is None:
+            self._open()
+        records = []
+        for name, data in members:
+            tarinfo = tarfile.TarInfo(name)
+            tarinfo.size = len(data)
+            self._tar.addfile(tarinfo, io.BytesIO(data))
+            # the data ends the member, padded to the tar block size (header length varies with the name)
+            offset = self._tar.offset - -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            records.append({"name": name, "offset": offset, "size": len(data)})
+        self._tar.fileobj.flush()
+        for record in records:
+            self._idx.write(json.dumps(record) + "\n")
+        self._idx.flush()
+        return {name: f"{self.shard_path}{SHARD_SEP}{name}" for name, _ in members}
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@lru_cache(maxsize=64)
+def load_shard_index(shard_path):
+    """{member name: (offset, size)} of a shard, a torn last line is ignored."""
+    index = {}
+    with open(shard_path + ".idx.jsonl", "r", encoding="utf-8") as fr:
+        for line in fr:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            index[record["name"]] = (record["offset"], record["size"])
+    return index
+
+
+def _member_span(shard_path, name):
+    index = load_shard_index(shard_path)
+    if name not in index:
+        # the shard may have grown since its index was cached
+        load_shard_index.cache_clear()
+        index = load_shard_index(shard_path)
+    return index.get(name)
+
+
+def has_member(path):
+    """True if "<shard path>::<member name>" is in the index of its shard."""
+    shard_path, name = path.rsplit(SHARD_SEP, 1)
+    if not os.path.exists(shard_path + ".idx.jsonl"):
+        return False
+    return _member_span(shard_path, name) is not None
+
+
+def read_member(path):
+    """Bytes of "<shard path>::<member name>"."""
+    shard_path, name = path.rsplit(SHARD_SEP, 1)
+    span = _member_span(shard_path, name)
+    if span is None:
+        raise KeyError(f"{name} is not in {shard_path}")
+    offset, size = span
+    with open(shard_path, "rb") as fr:
+        fr.seek(offset)
+        return fr.read(size)
+
+
+def open_image(path):
+    """Image.open for a file path or a "<shard path>::<member name>" path."""
+    if SHARD_SEP in path:
+        return Image.open(io.BytesIO(read_member(path)))
+    return Image.open(path)
@@ -2,32 +2,45 @@ from constant import CATEGORY_TO_CLASSES, DIST_DICT
 import os
 import json
 import random
+import hashlib
 import numpy as np
 
+# lookup tables built once, so the per-sample helpers below are O(1)
+NAME_TO_CLASS = {name: cls for cls, names in DIST_DICT.items() for name in names}
+CLASS_TO_CATEGORY = {cls: category for category, classes in CATEGORY_TO_CLASSES.items() for cls in classes}
+DIST_CLASSES = list(DIST_DICT.keys())
+# category -> classes that have at least one distortion function
+CATEGORY_POOL = {
+    category: [cls for cls in classes if DIST_DICT.get(cls)]
+    for category, classes in CATEGORY_TO_CLASSES.items()
+    if any(DIST_DICT.get(cls) for cls in classes)
+}
+
 def get_category_from_class(distortion_class):
-    for category, classes in CATEGORY_TO_CLASSES.items():
-        if distortion_class in classes:
-            return category
-    return None
+    return CLASS_TO_CATEGORY.get(distortion_class)
 
-def get_distortion_name(distortion_name):
-    all_names = [name for names in DIST_DICT.values() for name in names]
-    if distortion_name in all_names:
+def get_distortion_name(distortion_name, rng=random):
+    if distortion_name in NAME_TO_CLASS:
         return distortion_name
     if distortion_name in DIST_DICT:
-        return random.choice(DIST_DICT[distortion_name])
-    key = random.choice(list(DIST_DICT.keys()))
-    return random.choice(DIST_DICT[key])
+        return rng.choice(DIST_DICT[distortion_name])
+    key = rng.choice(DIST_CLASSES)
+    return rng.choice(DIST_DICT[key])
 
 def get_distortion_class(distortion_name):
-    for key in DIST_DICT:
-        if distortion_name in DIST_DICT[key]:
-            return key
+    return NAME_TO_CLASS.get(distortion_name)
 
 def seed_everything(seed=131):
     np.random.seed(seed)
     random.seed(seed**2)
 
+def derive_seed(seed, *keys):
+    # stable across processes and runs (unlike hash()), so the same
+    # (seed, reference, ...) always maps to the same 32-bit seed
+    text = ":".join(str(k) for k in (seed,) + keys)
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "little")
+
 def save_json_append(json_file_path, new_data):
     if os.path.exists(json_file_path):
         with open(json_file_path, "r") as fr:
@@ -54,16 +67,17 @@ def compute_category_weights():
 
 CATEGORY_WEIGHTS = compute_category_weights()
 
-def weighted_sample_without_replacement(categories, weight_map, k):
+def weighted_sample_without_replacement(categories, weight_map, k, rng=None):
+    rng = rng or random
     selected = []
     available = list(categories)
     for _ in range(min(k, len(available))):
         total_weight = sum(weight_map.get(cat, 0) for cat in available)
         if total_weight <= 0:
             # fall back to uniform random choice
-            choice = random.choice(available)
+            choice = rng.choice(available)
         else:
-            threshold = random.uniform(0, total_weight)
+            threshold = rng.uniform(0, total_weight)
             cumulative = 0.0
             choice = available[0]
             for cat in available:
@@ -75,6 +89,124 @@ def weighted_sample_without_replacement(categories, weight_map, k):
         available.remove(choice)
     return selected
     
+class CategorySampler:
+    """Weighted category sampler whose tables are built once from a weight map.
+
+    Draws with replacement use Vose alias tables, O(1) per draw and vectorized
+    over k. Draws without replacement, or from a subset of the categories, walk
+    a Fenwick tree of the weights, O(log n) per draw and per removal. Every draw
+    takes an explicit np.random.Generator, so workers can be seeded independently.
+    """
+
+    def __init__(self, weight_map):
+        """
+        @param weight_map (dict): category -> positive weight
+        """
+        self.categories = list(weight_map)
+        self.index = {category: i for i, category in enumerate(self.categories)}
+        self.weights = np.array([weight_map[category] for category in self.categories], dtype=np.float64)
+        if len(self.weights) == 0 or (self.weights <= 0).any():
+            raise ValueError("CategorySampler needs at least one category and positive weights")
+        self._prob, self._alias = self._build_alias(self.weights)
+        self._tree = self._build_fenwick(self.weights)
+        # plain floats, the draws without replacement are scalar updates
+        self._weight_list = self.weights.tolist()
+        self._total = float(self.weights.sum())
+        self._top_bit = 1 << (len(self.weights).bit_length() - 1)
+
+    @staticmethod
+    def _build_alias(weights):
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        prob = np.ones(n, dtype=np.float64)
+        alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] += scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        # what is left is 1 up to rounding
+        return prob, alias
+
+    @staticmethod
+    def _build_fenwick(weights):
+        n = len(weights)
+        tree = [0.0] * (n + 1)
+        for i, weight in enumerate(weights.tolist(), start=1):
+            tree[i] += weight
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        return tree
+
+    def _find(self, tree, r):
+        """Index of the category whose cumulative weight range holds r, None if r is past the last one.
+
+        r can reach the remaining sum by float rounding of the tree after removals.
+        """
+        pos, bit = 0, self._top_bit
+        while bit:
+            nxt = pos + bit
+            if nxt < len(tree) and tree[nxt] <= r:
+                pos = nxt
+                r -= tree[nxt]
+            bit >>= 1
+        return pos if pos < len(tree) - 1 else None
+
+    @staticmethod
+    def _update(tree, i, delta):
+        i += 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def sample(self, rng, k=1, excluded=None, replace=False):
+        """Draw k categories, proportionally to their weights.
+
+        @param rng (np.random.Generator): source of randomness
+        @param excluded (set): categories not to draw, ignored if they exclude every category
+        @param replace (bool): draw with replacement; without it at most
+            len(categories) - len(excluded) categories are returned
+        @return: list of categories
+        """
+        excluded = [self.index[c] for c in excluded or () if c in self.index]
+        if len(excluded) == len(self.categories):
+            excluded = []
+        if replace and not excluded:
+            i = rng.integers(len(self.categories), size=k)
+            i = np.where(rng.random(k) < self._prob[i], i, self._alias[i])
+            return [self.categories[j] for j in i]
+
+        weights = self._weight_list
+        tree = list(self._tree)
+        total = self._total
+        available = [True] * len(self.categories)
+        for i in excluded:
+            self._update(tree, i, -weights[i])
+            total -= weights[i]
+            available[i] = False
+        num_draws = k if replace else min(k, len(self.categories) - len(excluded))
+        selected = []
+        for u in rng.random(num_draws).tolist():
+            i = self._find(tree, u * total)
+            # rounding can land past the end or on a removed leaf, draw again
+            while i is None or not available[i]:
+                i = self._find(tree, rng.random() * total)
+            selected.append(self.categories[i])
+            if not replace:
+                self._update(tree, i, -weights[i])
+                total -= weights[i]
+                available[i] = False
+        return selected
+
+
+# weighted by the number of distortion functions, over the categories that have any
+CATEGORY_SAMPLER = CategorySampler({category: CATEGORY_WEIGHTS[category] for category in CATEGORY_POOL})
+
+
 def distortion_classes_equal(classes1, classes2):
     list1 = classes1 if isinstance(classes1, list) else [classes1]
     list2 = classes2 if isinstance(classes2, list) else [classes2]